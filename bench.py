@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+import extract
+import ir
+import pipeline
+import process
+import process_elixir
+
+# Benchmarks for each stage of the pipeline, run over snapshots of the docs
+# vendored into bench/fixtures: one directory per commit of the checkout they
+# were vendored from, holding the Markdown and the JSON process.py made from
+# it. The ones checked in come from a trimmed local copy of the docs, not from
+# discord-api-docs itself, so their COMMIT files only mean something there.
+# Re-vendor them whenever process.py's output changes.
+#
+#   bench.py vendor <docs checkout> <commit>...
+#       Snapshots the docs we process at each commit into bench/fixtures.
+#   bench.py run [--save-baseline] [--baseline <path>]
+#       Times every stage and compares against bench/baseline.json. Exits
+#       non-zero if any stage got slower than the allowed tolerance, and by
+#       more than --min-ms: the shortest stages take well under a millisecond,
+#       and scheduling noise alone moves those by more than any tolerance.
+#
+# Timings only compare on the same machine. bench/baseline.json is for running
+# this locally, CI measures the base branch for its baseline, see
+# .github/workflows/bench.yml.
+#
+# Stages:
+#   extract       Markdown -> h6/table elements (extract.py)
+#   process       elements -> JSON tables (process.py's main loop)
+#   clarify_type  every type resolution the process stage makes, cold
+#   derive        derive_type/extract_type for every field
+#   emit          JSON -> Elixir module assembly (process_elixir.py)
+
+bench_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+fixtures_dir = os.path.join(bench_dir, "fixtures")
+baseline_path = os.path.join(bench_dir, "baseline.json")
+stages = ["extract", "process", "clarify_type", "derive", "emit"]
+
+
+def git(docs_path, *args):
+    return subprocess.run(
+        ["git", "-C", docs_path, *args], capture_output=True, text=True, check=True
+    ).stdout
+
+
+def quiet():
+    # Nobody wants to see the same warnings a hundred times
+    return contextlib.redirect_stderr(io.StringIO())
+
+
+def vendor(docs_path, commits):
+    for commit in commits:
+        info = git(docs_path, "log", "-1", "--pretty=%H %aI", commit).strip()
+        target = os.path.join(fixtures_dir, info[:12])
+        os.makedirs(target, exist_ok=True)
+        resources = git(docs_path, "ls-tree", "--name-only", commit, "docs/resources/")
+        paths = [f"docs/topics/{topic}" for topic in pipeline.topics]
+        paths += sorted(resources.splitlines())
+        for path in paths:
+            text = git(docs_path, "show", f"{commit}:{path}")
+            name = pipeline.basename(path)
+            with open(os.path.join(target, name + ".md"), "w") as f:
+                f.write(text)
+            with quiet():
+                table = process.process(extract.extract(text))
+            with open(os.path.join(target, name + ".json"), "w") as f:
+                f.write(ir.dumps(table))
+        with open(os.path.join(target, "COMMIT"), "w") as f:
+            f.write(info + "\n")
+        print(f">> Vendored {len(paths)} docs from {info} into {target}")
+
+
+def load_fixture(path):
+    docs = {}
+    for name in sorted(os.listdir(path)):
+        module, ext = os.path.splitext(name)
+        if ext in (".md", ".json"):
+            with open(os.path.join(path, name)) as f:
+                docs.setdefault(module, {})[ext] = f.read()
+    return docs
+
+
+def best_of(repeat, fn):
+    # Like timeit, with the garbage collector off so that it doesn't land on
+    # whichever stage happens to be running when it kicks in
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best
+
+
+def record_clarify_type_calls(elements):
+    # Runs the process stage once, noting every top-level clarify_type call
+    calls = []
+    original = process.clarify_type
+    depth = 0
+
+    def recording(*args, **kwargs):
+        nonlocal depth
+        if depth == 0:
+            calls.append((args, kwargs))
+        depth += 1
+        try:
+            return original(*args, **kwargs)
+        finally:
+            depth -= 1
+
+    process.clarify_type = recording
+    try:
+        for doc in elements:
+            process.process(doc)
+    finally:
+        process.clarify_type = original
+    return calls
+
+
+def bench_fixture(docs, repeat):
+    texts = [doc[".md"] for doc in docs.values() if ".md" in doc]
+    documents = [
+        ir.loads(module, doc[".json"])
+        for (module, doc) in docs.items()
+        if ".json" in doc
+    ]
+    ir.define_symbols(ir.index_documents((document, None) for document in documents))
+    elements = [list(extract.extract(text)) for text in texts]
+    with quiet():
+        calls = record_clarify_type_calls(elements)
+
+    def run_extract():
+        for text in texts:
+            for _ in extract.extract(text):
+                pass
+
+    def run_process():
+        process.clarify_type.cache_clear()
+        for doc in elements:
+            process.process(doc)
+
+    def run_clarify_type():
+        process.clarify_type.cache_clear()
+        for (args, kwargs) in calls:
+            process.clarify_type(*args, **kwargs)
+
+    def run_derive():
+        # Start cold, or every repeat after the first is just lru_cache hits
+        process_elixir.refresh_types()
+        for document in documents:
+            for (key, section) in document.table.items():
+                if not key.endswith("structure"):
+                    continue
+                for (field, field_data) in section.fields.items():
+                    process_elixir.derive_type(field_data)
+                    process_elixir.extract_type(field_data.type, field)
+
+    def run_emit():
+        process_elixir.refresh_types()
+        for document in documents:
+            process_elixir.generate(
+                document.module, document.table, "bench", document.lines
+            )
+
+    fns = {
+        "extract": run_extract,
+        "process": run_process,
+        "clarify_type": run_clarify_type,
+        "derive": run_derive,
+        "emit": run_emit,
+    }
+    with quiet():
+        return {stage: best_of(repeat, fns[stage]) for stage in stages}
+
+
+def compare(results, baseline, tolerance, min_ms):
+    regressions = 0
+    print(f"{'fixture':<14}{'stage':<14}{'time':>10}{'baseline':>10}{'change':>9}")
+    for fixture, timings in results.items():
+        for stage in stages:
+            now = timings[stage]
+            then = baseline.get(fixture, {}).get(stage)
+            line = f"{fixture:<14}{stage:<14}{now * 1000:>8.2f}ms"
+            if then:
+                change = (now - then) / then
+                line += f"{then * 1000:>8.2f}ms{change:>+8.0%}"
+                if change > tolerance and (now - then) * 1000 > min_ms:
+                    line += "  REGRESSION"
+                    regressions += 1
+            print(line)
+    return regressions
+
+
+def run(repeat, tolerance, min_ms, save_baseline, baseline_path=baseline_path):
+    if not os.path.isdir(fixtures_dir) or not os.listdir(fixtures_dir):
+        print(
+            f"!! No fixtures in {fixtures_dir}; vendor some with "
+            "`bench.py vendor <docs checkout> <commit>...`",
+            file=sys.stderr,
+        )
+        return 1
+
+    results = {}
+    for fixture in sorted(os.listdir(fixtures_dir)):
+        path = os.path.join(fixtures_dir, fixture)
+        if os.path.isdir(path):
+            results[fixture] = bench_fixture(load_fixture(path), repeat)
+
+    if save_baseline:
+        with open(baseline_path, "w") as f:
+            f.write(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        compare(results, {}, tolerance, min_ms)
+        print(f">> Saved baseline to {baseline_path}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, tolerance, min_ms)
+    if regressions:
+        print(
+            f"!! {regressions} stages regressed by more than {tolerance:.0%} "
+            f"and {min_ms}ms"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    vendor_parser = commands.add_parser("vendor")
+    vendor_parser.add_argument("docs_path")
+    vendor_parser.add_argument("commits", nargs="+")
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--repeat", type=int, default=10)
+    run_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown per stage, as a fraction of the baseline",
+    )
+    run_parser.add_argument(
+        "--min-ms",
+        type=float,
+        default=0.5,
+        help="slowdowns of less than this many milliseconds are never regressions",
+    )
+    run_parser.add_argument("--save-baseline", action="store_true")
+    run_parser.add_argument("--baseline", default=baseline_path)
+    args = parser.parse_args()
+
+    if args.command == "vendor":
+        vendor(args.docs_path, args.commits)
+    else:
+        sys.exit(
+            run(
+                args.repeat,
+                args.tolerance,
+                args.min_ms,
+                args.save_baseline,
+                args.baseline,
+            )
+        )
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import hashlib
+import marshal
+import os
+import time
+
+# Persistent on-disk cache for pipeline stages. Entries are marshalled dicts of
+# plain values (str, bytes, numbers...) keyed by a content hash, one file per
+# entry. Hits bump the entry's mtime so
+# that eviction is least-recently-used.
+
+default_dir = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "discord-codegen",
+)
+# 256MB
+default_max_bytes = 256 * 1024 * 1024
+# 30 days
+default_max_age = 30 * 24 * 60 * 60
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length-prefixed so that ("ab", "c") and ("a", "bc") don't collide
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def file_digest(*paths):
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return digest(*contents)
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def get(cache_dir, key):
+    path = entry_path(cache_dir, key)
+    try:
+        with open(path, "rb") as f:
+            value = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        # Missing, truncated or from an older format
+        return None
+    if not isinstance(value, dict):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def put(cache_dir, key, value):
+    path = entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write-then-rename so a concurrent run never sees half an entry
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump(value, f)
+    os.replace(tmp, path)
+
+
+def evict(cache_dir, max_bytes=default_max_bytes, max_age=default_max_age):
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    cutoff = time.time() - max_age
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    # Oldest first: drop anything past the age bound, then keep going until
+    # we're under the size bound.
+    for mtime, size, path in sorted(entries):
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+import html
+import re
+import xml.etree.ElementTree as ET
+
+# This replaces the old `pandoc | xmllint | xpath` chain. We only ever cared
+# about two things in the docs: top-level h6 headers (that aren't examples) and
+# pipe tables. Rather than rendering the entire document to HTML and querying
+# it, we scan the Markdown ourselves and build the same tree pandoc would have
+# given us, ie.
+#
+#   <div>
+#     <h6 id="...">Channel Structure</h6>
+#     <table><thead><tr><th/>...</tr></thead><tbody><tr><td/>...</tr></tbody></table>
+#   </div>
+#
+# Inline markup inside of cells is kept as child elements (links, code, etc.)
+# so that `full_text` and friends in process.py behave the same way.
+
+heading_re = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$")
+fence_re = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+delimiter_re = re.compile(r"^ {0,3}\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+link_re = re.compile(r"\[((?:\\.|[^\]])*)\]\(([^)\s]*)(?:\s+\"[^\"]*\")?\)")
+escapable = "\\`*_{}[]()#+-.!|<>~\"'$%&=:;,/?@^"
+
+
+def heading_id(text):
+    # Roughly pandoc's auto_identifiers extension. We only use this for the
+    # "no examples" check, so it doesn't need to be exact.
+    text = re.sub(r"[^\w\s.-]", "", text.lower())
+    text = re.sub(r"\s+", "-", text.strip())
+    return re.sub(r"^[^a-z]+", "", text)
+
+
+def split_row(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    cells = []
+    cell = ""
+    in_code = False
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c == "\\" and i + 1 < len(line) and not in_code:
+            cell += line[i : i + 2]
+            i += 2
+            continue
+        if c == "`":
+            in_code = not in_code
+        elif c == "|" and not in_code:
+            cells.append(cell.strip())
+            cell = ""
+            i += 1
+            continue
+        cell += c
+        i += 1
+    cells.append(cell.strip())
+    return cells
+
+
+def append_text(parent, text):
+    if not text:
+        return
+    text = html.unescape(text)
+    if len(parent):
+        parent[-1].tail = (parent[-1].tail or "") + text
+    else:
+        parent.text = (parent.text or "") + text
+
+
+def inline(parent, text):
+    # Just enough of pandoc's inline syntax for the docs tables: backslash
+    # escapes, code spans, links and */** emphasis.
+    buf = ""
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == "\\" and i + 1 < len(text) and text[i + 1] in escapable:
+            buf += text[i + 1]
+            i += 2
+            continue
+        if c == "`":
+            end = text.find("`", i + 1)
+            if end != -1:
+                append_text(parent, buf)
+                buf = ""
+                code = ET.SubElement(parent, "code")
+                code.text = text[i + 1 : end].strip()
+                i = end + 1
+                continue
+        elif c == "[":
+            match = link_re.match(text, i)
+            if match:
+                append_text(parent, buf)
+                buf = ""
+                a = ET.SubElement(parent, "a", href=match.group(2))
+                inline(a, match.group(1))
+                i = match.end()
+                continue
+        elif c == "*":
+            marker = "**" if text.startswith("**", i) else "*"
+            end = text.find(marker, i + len(marker))
+            inner = text[i + len(marker) : end]
+            if end != -1 and inner.strip() == inner and inner:
+                append_text(parent, buf)
+                buf = ""
+                tag = "strong" if marker == "**" else "em"
+                inline(ET.SubElement(parent, tag), inner)
+                i = end + len(marker)
+                continue
+        buf += c
+        i += 1
+    append_text(parent, buf)
+
+
+def is_table_start(lines, i):
+    return (
+        i + 1 < len(lines)
+        and "|" in lines[i]
+        and not lines[i].startswith(("    ", "\t", ">"))
+        and delimiter_re.match(lines[i + 1]) is not None
+    )
+
+
+def make_table(header, rows):
+    table = ET.Element("table")
+    header_row = ET.SubElement(ET.SubElement(table, "thead"), "tr")
+    for cell in header:
+        inline(ET.SubElement(header_row, "th"), cell)
+    tbody = ET.SubElement(table, "tbody")
+    for row in rows:
+        # Pandoc pads short rows and drops anything past the header width
+        row = (row + [""] * len(header))[: len(header)]
+        tr = ET.SubElement(tbody, "tr")
+        for cell in row:
+            inline(ET.SubElement(tr, "td"), cell)
+    return table
+
+
+def extract(text):
+    # Yields the top-level h6 and table elements of a Markdown document, in
+    # document order.
+    lines = text.splitlines()
+    fence = None
+    # Pandoc only starts a table or header at the start of a block, so track
+    # whether the previous line ended one.
+    block_start = True
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+                block_start = True
+            i += 1
+            continue
+        match = fence_re.match(line)
+        if match:
+            fence = match.group(1)
+            i += 1
+            continue
+        match = heading_re.match(line) if block_start else None
+        if match:
+            level, title = match.groups()
+            if len(level) == 6 and "example" not in heading_id(title):
+                h6 = ET.Element("h6", id=heading_id(title))
+                inline(h6, title.strip())
+                yield h6
+            block_start = True
+            i += 1
+            continue
+        if block_start and is_table_start(lines, i):
+            header = split_row(line)
+            rows = []
+            i += 2
+            while i < len(lines) and lines[i].strip() and "|" in lines[i]:
+                rows.append(split_row(lines[i]))
+                i += 1
+            yield make_table(header, rows)
+            block_start = False
+            continue
+        block_start = not line.strip()
+        i += 1
+
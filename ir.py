@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import importlib
+import json
+import marshal
+import os
+import sys
+
+# The intermediate representation everything after process.py works from.
+# process.py builds a table per doc, one entry per section:
+#
+#   {
+#     "channel_structure": {
+#       "id": {"type": "snowflake", "desc": "...", "optional": False, ...},
+#       ...
+#     },
+#     "channel_types_enum": {
+#       "GUILD_TEXT": {"value": "0", "desc": "..."},
+#       "DM": "1",
+#       ...
+#     },
+#   }
+#
+# That table is what ends up in out/*.json. Emitters get it as records instead
+# (see `build`): a Structure of Fields for every section, except for enums,
+# which are an Enum of Members.
+#
+# Code generators are emitters registered against the IR. The docs get parsed
+# once and every registered target is generated from the same IR.
+
+Document = namedtuple("Document", ["module", "table", "lines"])
+
+# emit(write, document, git_info, start) writes the target's source for one
+# doc through `write`. `counters` and `warnings` are the emitter's Counters,
+# reset by the pipeline before each doc. `support` maps file names (without
+# the extension) to any source the generated code needs besides the docs',
+# written out next to it.
+Emitter = namedtuple(
+    "Emitter",
+    ["name", "label", "extension", "emit", "counters", "warnings", "support"],
+)
+emitters = {}
+
+# Bump whenever the packed layout changes
+pack_version = 1
+
+# What the pipeline keeps in its output directory besides the docs' JSON.
+# Anything looking for docs in there has to skip these.
+state_name = ".pipeline-state.json"
+report_name = "report.json"
+manifest_name = "manifest.json"
+pipeline_files = {state_name, report_name, manifest_name}
+
+# Corpus-wide index of every structure and enum: name -> the doc (`module`)
+# defining it and the file (`source`) it came from, so that references to
+# other docs resolve with a lookup. Whoever runs the emitters fills it in
+# through define_symbols. Enums also carry their `kind`, see enum_kind.
+Symbol = namedtuple("Symbol", ["module", "source", "kind"], defaults=[None])
+symbols = {}
+# Called whenever `symbols` changes, for emitters to rebuild anything they
+# derive from it
+symbol_listeners = []
+
+
+class Field:
+    # `extra` holds any per-section columns (oauth_scope, action_type...) and
+    # is None for the vast majority of fields that have none.
+    __slots__ = ("type", "desc", "optional", "nullable", "extra")
+
+    def __init__(self, type, desc, optional=False, nullable=False, extra=None):
+        self.type = type
+        self.desc = desc
+        self.optional = optional
+        self.nullable = nullable
+        self.extra = extra
+
+
+class Member:
+    # `desc` is None for members that were a bare value in the table
+    __slots__ = ("value", "desc", "extra")
+
+    def __init__(self, value, desc=None, extra=None):
+        self.value = value
+        self.desc = desc
+        self.extra = extra
+
+
+class Structure:
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+
+class Enum:
+    __slots__ = ("members",)
+
+    def __init__(self, members):
+        self.members = members
+
+
+# Types an emitter couldn't resolve, as (type, section, field). Emitters add
+# to it as they go, whoever runs them clears it between docs.
+unresolved = []
+
+
+def report_unresolved(type, section, field):
+    unresolved.append((type, section, field))
+
+
+def print_unresolved(entries, file=sys.stderr):
+    # `entries` are (type, section, field, source file)
+    print(f"!! {len(entries)} unresolved types:", file=file)
+    for (type, section, field, source) in sorted(entries):
+        print(f"!!   {type} in {section}.{field} ({source})", file=file)
+
+
+def register_emitter(name, label, extension, emit, counters, warnings, support=None):
+    if name in emitters and emitters[name].emit is not emit:
+        raise ValueError(f"Emitter {name} is already registered")
+    emitters[name] = Emitter(
+        name, label, extension, emit, counters, warnings, support or {}
+    )
+
+
+def load_plugins(names):
+    # Plugins register their emitters when imported
+    for name in names:
+        importlib.import_module(name)
+
+
+def is_enum(name):
+    return name.endswith("enum")
+
+
+def is_symbol(name):
+    return name.endswith(("_structure", "_enum"))
+
+
+def value_kind(value):
+    # Flags are written as shifts, eg. `1 << 3`
+    if "<<" in value:
+        return "integer"
+    for base in (10, 0):
+        try:
+            int(value, base)
+            return "integer"
+        except ValueError:
+            pass
+    return "string"
+
+
+def enum_kind(enum):
+    # "integer" or "string" when all of the members' values are one, so that
+    # emitters can type the enum as such, otherwise "mixed"
+    kinds = {value_kind(member.value) for member in enum.members.values()}
+    return kinds.pop() if len(kinds) == 1 else "mixed"
+
+
+def document_symbols(document, source=None):
+    return {
+        name: Symbol(
+            document.module,
+            source,
+            enum_kind(record) if isinstance(record, Enum) else None,
+        )
+        for (name, record) in document.table.items()
+        if is_symbol(name)
+    }
+
+
+def index_documents(documents):
+    # Builds the index for (document, source) pairs in doc order. If two docs
+    # define the same thing, the first one wins.
+    index = {}
+    for (document, source) in documents:
+        for (name, symbol) in document_symbols(document, source).items():
+            index.setdefault(name, symbol)
+    return index
+
+
+def define_symbols(entries, replace=False):
+    # With `replace`, anything that isn't in `entries` is dropped
+    changed = {
+        name: symbol
+        for (name, symbol) in entries.items()
+        if symbols.get(name) != symbol
+    }
+    removed = set(symbols) - set(entries) if replace else set()
+    if changed or removed:
+        for name in removed:
+            del symbols[name]
+        symbols.update(changed)
+        for listener in symbol_listeners:
+            listener()
+
+
+def build_field(data):
+    extra = {
+        key: value
+        for (key, value) in data.items()
+        if key not in ("type", "desc", "optional", "nullable")
+    }
+    return Field(
+        sys.intern(data.get("type", "")),
+        data.get("desc", ""),
+        data.get("optional", False),
+        data.get("nullable", False),
+        extra or None,
+    )
+
+
+def build_member(data):
+    if isinstance(data, str):
+        return Member(data)
+    extra = {
+        key: value for (key, value) in data.items() if key not in ("value", "desc")
+    }
+    return Member(data["value"], data.get("desc"), extra or None)
+
+
+def build(module, table, lines):
+    # Table -> records. `lines` is the size of the table's JSON, which the
+    # Elixir emitter likes to brag about.
+    records = {}
+    for (name, section) in table.items():
+        if is_enum(name):
+            records[name] = Enum(
+                {key: build_member(value) for (key, value) in section.items()}
+            )
+        else:
+            records[name] = Structure(
+                {key: build_field(value) for (key, value) in section.items()}
+            )
+    return Document(module, records, lines)
+
+
+def dumps(table):
+    return json.dumps(table, indent=2) + "\n"
+
+
+def loads(module, text):
+    return build(module, json.loads(text), len(text.splitlines(keepends=True)))
+
+
+def write(path, text):
+    # How the pipeline and the emitters write out everything they generate.
+    # Write-then-rename, and only if the file doesn't already hold `text`, so
+    # that unchanged modules keep their mtimes and don't get recompiled.
+    # Returns whether anything was written.
+    data = text.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def pack(document):
+    # Compact binary form of a document, for the cache and for handing
+    # documents between processes. It's all tuples of strings, which marshal
+    # loads about as fast as Python can allocate them. Equal strings are
+    # shared so that marshal only writes each one once.
+    strings = {}
+
+    def share(s):
+        return strings.setdefault(s, s) if isinstance(s, str) else s
+
+    def extra(data):
+        if data is None:
+            return None
+        return tuple((share(key), share(value)) for (key, value) in data.items())
+
+    sections = []
+    for (name, record) in document.table.items():
+        if isinstance(record, Enum):
+            entries = tuple(
+                (share(key), share(m.value), share(m.desc), extra(m.extra))
+                for (key, m) in record.members.items()
+            )
+        else:
+            entries = tuple(
+                (
+                    share(key),
+                    # Types stay interned through marshal
+                    sys.intern(f.type),
+                    share(f.desc),
+                    f.optional,
+                    f.nullable,
+                    extra(f.extra),
+                )
+                for (key, f) in record.fields.items()
+            )
+        sections.append((name, entries))
+    return marshal.dumps(
+        (pack_version, document.module, document.lines, tuple(sections))
+    )
+
+
+def unpack(blob):
+    version, module, lines, sections = marshal.loads(blob)
+    if version != pack_version:
+        raise ValueError(f"Unsupported IR pack version {version}")
+    table = {}
+    for (name, entries) in sections:
+        if is_enum(name):
+            table[name] = Enum(
+                {
+                    key: Member(value, desc, dict(extra) if extra else None)
+                    for (key, value, desc, extra) in entries
+                }
+            )
+        else:
+            table[name] = Structure(
+                {
+                    key: Field(
+                        type, desc, optional, nullable, dict(extra) if extra else None
+                    )
+                    for (key, type, desc, optional, nullable, extra) in entries
+                }
+            )
+    return Document(module, table, lines)
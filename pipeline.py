@@ -0,0 +1,859 @@
+#!/usr/bin/env python
+
+import argparse
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import contextlib
+from datetime import datetime, timezone
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import cache
+import extract
+import ir
+import process
+
+# Emitters register themselves with ir.py on import
+import process_elixir
+import watch
+
+# pipeline.py <docs checkout> <output dir> "<git info>"
+#
+# Both stages (Markdown -> IR, IR -> code) go into one dependency graph that
+# runs on a process pool. A doc's code gets queued as soon as it can be
+# generated instead of waiting for the rest of the corpus to be parsed. Each
+# doc is parsed once, whatever the number of targets: every --target registered
+# in ir.py (Elixir by default, more with --plugin) is generated from the same
+# IR.
+#
+# Results of both stages are cached on disk, keyed by a hash of their input
+# plus the code that produced them, so unchanged docs are never reprocessed.
+#
+# With --incremental, the docs commit of the last run is remembered in the
+# output directory and only docs that git says changed since then (plus any
+# modules referencing their structures) are regenerated.
+#
+# Structures are resolved through a symbol table of everything the docs define
+# (see ir.py), so a doc's code is only generated once the docs defining what it
+# references have been parsed.
+#
+# With --watch, the pipeline stays up after the run and regenerates docs as
+# they're edited, see watch_docs.
+#
+# Every run writes report.json to the output directory: per doc timings, sizes,
+# counts and warnings for each stage. Types no target could resolve are listed
+# at the end, and make for a non-zero exit status.
+
+# Topics we need on top of everything in docs/resources
+topics = ["Gateway.md", "Permissions.md", "Teams.md", "OAuth2.md"]
+watched_dirs = ["docs/resources", "docs/topics"]
+symbol_re = re.compile(r"\w+_(?:structure|enum)")
+
+
+def doc_paths(docs_path):
+    resources_path = os.path.join(docs_path, "docs", "resources")
+    topics_path = os.path.join(docs_path, "docs", "topics")
+    resources = sorted(
+        os.path.join(resources_path, name)
+        for name in os.listdir(resources_path)
+        if os.path.isfile(os.path.join(resources_path, name))
+    )
+    return [os.path.join(topics_path, topic) for topic in topics] + resources
+
+
+def basename(path):
+    return os.path.splitext(os.path.basename(path))[0].lower()
+
+
+def code_digest(*extra_paths):
+    # Any change to the generators invalidates everything they produced. That
+    # includes this file and the cache's, which make part of what's cached.
+    return cache.file_digest(
+        extract.__file__,
+        process.__file__,
+        ir.__file__,
+        cache.__file__,
+        __file__,
+        *extra_paths,
+    )
+
+
+def code_key(targets, type_rules=None, settings=None):
+    # Everything besides the docs that goes into the output: the code, the
+    # type rules and the settings
+    return cache.digest(
+        code_digest(
+            *([type_rules] if type_rules else []),
+            *sorted({emitter_path(target) for target in targets}),
+        ),
+        json.dumps(settings or {}, sort_keys=True),
+    )
+
+
+def emitter_path(target):
+    return sys.modules[ir.emitters[target].emit.__module__].__file__
+
+
+def target_path(output_dir, target, module):
+    return os.path.join(output_dir, target, module + ir.emitters[target].extension)
+
+
+def measure(stage, fn):
+    # Runs `fn` with the stage's counters reset. Warnings are captured per doc
+    # so that the logs come out in the same order no matter which worker
+    # finishes first.
+    stage.counters.clear()
+    stage.warnings.clear()
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stderr(log):
+        out = fn()
+    metrics = dict(stage.counters)
+    metrics["ms"] = round((time.perf_counter() - start) * 1000, 3)
+    metrics["warnings"] = dict(stage.warnings)
+    return out, log.getvalue(), metrics
+
+
+def doc_info(document, text):
+    # What the pipeline needs to know about a doc besides its IR, so that the
+    # JSON never has to be loaded again: a digest of it for cache keys, its
+    # size, the structures and enums it defines and references and the kinds
+    # of the enums (see ir.enum_kind).
+    defines = set(document.table)
+    references = set()
+    for record in document.table.values():
+        if isinstance(record, ir.Structure):
+            for field in record.fields.values():
+                references.update(symbol_re.findall(field.type))
+    return {
+        "digest": cache.digest(text),
+        "lines": document.lines,
+        "defines": sorted(defines),
+        "references": sorted(references - defines),
+        "kinds": {
+            name: symbol.kind
+            for (name, symbol) in ir.document_symbols(document).items()
+            if symbol.kind is not None
+        },
+    }
+
+
+def configure(type_rules, plugins, settings):
+    # Applies a run's type rules, plugins and settings to this process. Pool
+    # workers run it too when they start: they only inherit it from the
+    # parent with the fork start method, and that isn't the default
+    # everywhere (spawn on macOS, forkserver from Python 3.14 on Linux).
+    if type_rules:
+        process.load_type_rules(type_rules)
+    ir.load_plugins(plugins)
+    process_elixir.use_integer_snowflakes(settings.get("snowflake_integers", False))
+    process_elixir.use_atom_enums(settings.get("atom_enums", False))
+    process_elixir.use_deterministic_output(settings.get("deterministic", False))
+
+
+def parse_doc(path, output_dir, cache_dir=None, key=None):
+    # Writes the doc's JSON to `output_dir` and caches everything under `key`
+    # right here, so that only the packed IR the emitters work from and the
+    # doc_info make it back
+    table, log, metrics = measure(process, lambda: process.process_file(path))
+    text = ir.dumps(table)
+    document = ir.build(basename(path), table, text.count("\n"))
+    blob = ir.pack(document)
+    info = doc_info(document, text)
+    metrics["bytes_in"] = os.path.getsize(path)
+    metrics["bytes_out"] = len(text.encode("utf-8"))
+    metrics["ir_bytes"] = len(blob)
+    ir.write(os.path.join(output_dir, basename(path) + ".json"), text)
+    if cache_dir:
+        cache.put(
+            cache_dir,
+            key,
+            {"json": text, "ir": blob, "info": info, "log": log, "metrics": metrics},
+        )
+    return (blob, info), log, metrics
+
+
+def emit_doc(blob, git_info, targets, plugins=(), symbols=None):
+    # The IR gets unpacked once and handed to every target. `symbols` are the
+    # entries of the symbol table this doc needs.
+    ir.load_plugins(plugins)
+    ir.define_symbols(symbols or {})
+    document = ir.unpack(blob)
+    results = {}
+    for target in targets:
+        emitter = ir.emitters[target]
+        chunks = []
+        del ir.unresolved[:]
+        _, log, metrics = measure(
+            emitter, lambda: emitter.emit(chunks.append, document, git_info)
+        )
+        out = "".join(chunks) + "\n"
+        metrics["unresolved"] = [list(entry) for entry in ir.unresolved]
+        metrics["bytes_in"] = len(blob)
+        metrics["bytes_out"] = len(out.encode("utf-8"))
+        results[target] = (out, log, metrics)
+    return results
+
+
+def run(
+    paths,
+    output_dir,
+    git_info,
+    targets=("elixir",),
+    plugins=(),
+    workers=None,
+    cache_dir=None,
+    cache_max_bytes=cache.default_max_bytes,
+    cache_max_age=cache.default_max_age,
+    emit_only=(),
+    type_rules=None,
+    order=None,
+    known=None,
+    settings=None,
+):
+    # Docs in `emit_only` weren't touched, so their JSON is taken from the
+    # output directory as-is and only the Elixir is regenerated.
+    #
+    # Everything a doc defines goes into a symbol table as soon as it's been
+    # parsed. A doc is emitted once everything it references is in there for
+    # good, or once every doc has been parsed. If two docs define the same
+    # thing the first one in `order` (module -> position, defaults to the
+    # order of `paths`) wins, so nothing is final until every doc before its
+    # definition has been parsed too. `known` is the symbol table for docs
+    # outside of `paths`.
+    code = code_key(targets, type_rules, settings)
+    logs = [[] for _ in paths]
+    stages_left = [1 + len(targets)] * len(paths)
+    printed = 0
+    pending = {}
+    docs = {}
+    report = {}
+    position = order or {basename(path): k for k, path in enumerate(paths)}
+    index = dict(known or {})
+    owners = {name: position[symbol.module] for name, symbol in index.items()}
+    unparsed = {position[basename(path)] for path in paths}
+    waiting = {}
+
+    def cached(key):
+        return cache.get(cache_dir, key) if cache_dir else None
+
+    def store(key, value):
+        if cache_dir:
+            cache.put(cache_dir, key, value)
+
+    def define(i, info):
+        # Returns warnings about anything that's already defined elsewhere
+        module = basename(paths[i])
+        warnings = ""
+        for name in filter(ir.is_symbol, info["defines"]):
+            other = index[name].module if name in owners else module
+            if other != module:
+                first, second = sorted([module, other], key=position.get)
+                warnings += f"Warning: {name} is defined by both {first} and "
+                warnings += f"{second}, using {first}\n"
+            if name not in owners or position[module] < owners[name]:
+                index[name] = ir.Symbol(module, paths[i], info["kinds"].get(name))
+                owners[name] = position[module]
+        return warnings
+
+    def resolved(name):
+        return name in owners and owners[name] < min(unparsed)
+
+    def schedule():
+        for i in sorted(waiting):
+            info, blob, names = waiting[i]
+            if unparsed and not all(map(resolved, names)):
+                continue
+            del waiting[i]
+            symbols = {name: index[name] for name in sorted(names) if name in index}
+            module = basename(paths[i])
+            keys = {}
+            for target in targets:
+                # The module name ends up in the output, two docs that parse
+                # to the same JSON still make different code
+                key = cache.digest(
+                    info["digest"], module, code, git_info, target, repr(symbols)
+                )
+                hit = cached(key)
+                if hit is not None:
+                    emitted(
+                        i, target, hit["out"], hit["log"], hit.get("metrics"), True
+                    )
+                else:
+                    keys[target] = key
+            if keys:
+                future = pool.submit(
+                    emit_doc, blob, git_info, list(keys), plugins, symbols
+                )
+                pending[future] = (i, "emit", keys)
+
+    def parsed(i, blob, info, log, metrics=None, is_cached=False):
+        module = basename(paths[i])
+        log += define(i, info)
+        docs[module] = info
+        report[module] = {"source": paths[i]}
+        if paths[i] not in emit_only:
+            note = " (cached)" if is_cached else ""
+            logs[i].append((f">> Processing file: {paths[i]}{note}", log))
+            report[module]["parse"] = dict(metrics or {}, cached=is_cached)
+        report[module]["emit"] = {}
+        stages_left[i] -= 1
+
+        unparsed.discard(position[module])
+        waiting[i] = (info, blob, set(info["defines"]) | set(info["references"]))
+        schedule()
+
+    def emitted(i, target, out, log, metrics=None, is_cached=False):
+        module = basename(paths[i])
+        path = target_path(output_dir, target, module)
+        changed = ir.write(path, out)
+        note = " (cached)" if is_cached else ""
+        if not changed:
+            note += " (unchanged)"
+        label = ir.emitters[target].label
+        logs[i].append((f">> Processing JSON -> {label}: {path}{note}", log))
+        report[module]["emit"][target] = dict(
+            metrics or {},
+            cached=is_cached,
+            changed=changed,
+            sha256=hashlib.sha256(out.encode("utf-8")).hexdigest(),
+        )
+        stages_left[i] -= 1
+
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=configure,
+        initargs=(type_rules, plugins, settings or {}),
+    ) as pool:
+        for i, path in enumerate(paths):
+            if path in emit_only:
+                module = basename(path)
+                with open(os.path.join(output_dir, module + ".json")) as f:
+                    text = f.read()
+                document = ir.loads(module, text)
+                parsed(i, ir.pack(document), doc_info(document, text), "")
+                continue
+            with open(path, "rb") as f:
+                # The packed IR has the module name in it
+                key = cache.digest(f.read(), basename(path), code)
+            hit = cached(key)
+            if hit is not None and "info" in hit:
+                ir.write(
+                    os.path.join(output_dir, basename(path) + ".json"), hit["json"]
+                )
+                parsed(i, hit["ir"], hit["info"], hit["log"], hit["metrics"], True)
+            else:
+                future = pool.submit(parse_doc, path, output_dir, cache_dir, key)
+                pending[future] = (i, "parse", key)
+
+        while pending or printed < len(paths):
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            else:
+                done = []
+            for future in done:
+                i, stage, key = pending.pop(future)
+                if stage == "parse":
+                    (blob, info), log, metrics = future.result()
+                    parsed(i, blob, info, log, metrics)
+                    continue
+                # One result per target, in the order they were asked for
+                for target, (out, log, metrics) in future.result().items():
+                    store(key[target], {"out": out, "log": log, "metrics": metrics})
+                    emitted(i, target, out, log, metrics)
+
+            # Flush whatever is finished, in input order
+            while printed < len(paths) and stages_left[printed] == 0:
+                for message, log in logs[printed]:
+                    print(message)
+                    sys.stdout.flush()
+                    sys.stderr.write(log)
+                    sys.stderr.flush()
+                printed += 1
+
+    if cache_dir:
+        cache.evict(cache_dir, cache_max_bytes, cache_max_age)
+    return docs, report
+
+
+def write_report(output_dir, git_info, started, files):
+    # Machine-readable summary of the run, for tracking how the pipeline
+    # performs over time. Every counter is also summed up under "totals".
+    totals = Counter()
+    warnings = Counter()
+    for entry in files.values():
+        stages = [("parse", entry.get("parse", {}))]
+        for target, metrics in sorted(entry.get("emit", {}).items()):
+            stages.append((f"emit_{target}", metrics))
+        for stage, metrics in stages:
+            for name, value in metrics.items():
+                if name == "warnings":
+                    warnings.update(value)
+                elif name != "cached" and isinstance(value, (int, float)):
+                    totals[f"{stage}_{name}"] += value
+    totals = {name: round(value, 3) for name, value in totals.items()}
+    totals["warnings"] = dict(warnings)
+    report = {
+        "docs_commit": git_info,
+        "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "wall_ms": round((time.time() - started) * 1000, 3),
+        "files": files,
+        "totals": totals,
+    }
+    ir.write(
+        os.path.join(output_dir, ir.report_name),
+        json.dumps(report, indent=2, sort_keys=True) + "\n",
+    )
+
+
+def write_manifest(output_dir, git_info, docs, report):
+    # Everything deterministic output leaves out of the headers, for every
+    # generated file: its doc, the docs commit and time it was last generated
+    # at and how long that took. Files that came out the same as before keep
+    # their old entry.
+    path = os.path.join(output_dir, ir.manifest_name)
+    try:
+        with open(path) as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        files = {}
+    generated_at = datetime.now(timezone.utc).isoformat()
+    for module, entry in report.items():
+        for target, metrics in entry["emit"].items():
+            name = os.path.join(target, module + ir.emitters[target].extension)
+            if metrics["changed"] or name not in files:
+                files[name] = {
+                    "source": entry["source"],
+                    "docs_commit": git_info,
+                    "generated_at": generated_at,
+                    "json_lines": docs[module]["lines"],
+                    "ms": metrics.get("ms"),
+                    "sha256": metrics["sha256"],
+                }
+    files = {
+        name: entry
+        for name, entry in files.items()
+        if os.path.exists(os.path.join(output_dir, name))
+    }
+    ir.write(path, json.dumps({"files": files}, indent=2, sort_keys=True) + "\n")
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, ir.state_name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(output_dir, commit, code, targets, settings, modules):
+    # `code` is the run's code_key
+    state = {
+        "commit": commit,
+        "code": code,
+        "targets": sorted(targets),
+        "settings": settings,
+        "modules": modules,
+    }
+    ir.write(
+        os.path.join(output_dir, ir.state_name),
+        json.dumps(state, indent=2, sort_keys=True) + "\n",
+    )
+
+
+def changed_paths(docs_path, since):
+    # Renames show up as a delete + an add, which is what we want here
+    diff = subprocess.run(
+        ["git", "-C", docs_path, "diff", "--name-only", "--no-renames", since, "HEAD"]
+        + ["--"]
+        + watched_dirs,
+        capture_output=True,
+        text=True,
+    )
+    if diff.returncode != 0:
+        return None
+    return {os.path.join(docs_path, line) for line in diff.stdout.splitlines()}
+
+
+def dependents(modules, changed):
+    # Modules that reference anything defined by a changed module
+    changed_symbols = set()
+    for module in changed:
+        changed_symbols.update(modules.get(module, {}).get("defines", []))
+    return {
+        module
+        for module, entry in modules.items()
+        if module not in changed and changed_symbols & set(entry["references"])
+    }
+
+
+def unresolved_types(paths, modules):
+    # Everything any target couldn't resolve in the current docs, see
+    # ir.print_unresolved
+    unresolved = set()
+    for path in paths:
+        for entry in modules.get(basename(path), {}).get("unresolved", []):
+            unresolved.add(tuple(entry) + (path,))
+    return sorted(unresolved)
+
+
+def remove_outputs(output_dir, targets, module):
+    paths = [os.path.join(output_dir, module + ".json")]
+    paths += [
+        target_path(output_dir, target, module)
+        for target in targets
+        if target in ir.emitters
+    ]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def known_symbols(paths, modules, exclude=()):
+    # Symbol table for the docs in `modules` (as saved by save_state) that are
+    # still around. The first definition in doc order wins, same as in run.
+    index = {}
+    for path in paths:
+        module = basename(path)
+        if module in modules and module not in exclude:
+            kinds = modules[module].get("kinds", {})
+            for name in filter(ir.is_symbol, modules[module]["defines"]):
+                index.setdefault(name, ir.Symbol(module, path, kinds.get(name)))
+    return index
+
+
+def regenerate(
+    docs_path,
+    output_dir,
+    git_info,
+    incremental=False,
+    targets=("elixir",),
+    plugins=(),
+    snowflake_integers=False,
+    atom_enums=False,
+    deterministic=False,
+    **kwargs,
+):
+    started = time.time()
+    settings = {
+        "snowflake_integers": snowflake_integers,
+        "atom_enums": atom_enums,
+        "deterministic": deterministic,
+    }
+    configure(kwargs.get("type_rules"), plugins, settings)
+    kwargs.update(targets=targets, plugins=plugins, settings=settings)
+    commit = git_info.split(" ")[0]
+    for target in targets:
+        os.makedirs(os.path.join(output_dir, target), exist_ok=True)
+        for name, text in ir.emitters[target].support.items():
+            ir.write(target_path(output_dir, target, name), text)
+    paths = doc_paths(docs_path)
+    kwargs["order"] = {basename(path): k for k, path in enumerate(paths)}
+    current = {basename(path) for path in paths}
+    state = load_state(output_dir)
+    if state is not None:
+        # The last run's output gets written over rather than cleared out
+        # first, so whatever it generated for docs that are gone goes here
+        for module in sorted(set(state["modules"]) - current):
+            print(f">> Removing {module}")
+            remove_outputs(output_dir, state.get("targets", []), module)
+    if not incremental:
+        state = None
+    changed = None
+    code = code_key(targets, kwargs.get("type_rules"), settings)
+    if state is not None and (
+        state.get("targets") != sorted(targets)
+        or state.get("settings") != settings
+        or state.get("code") != code
+    ):
+        # Otherwise the docs that did change would come out of a different
+        # generator than the rest
+        print(">> Code, type rules, targets or settings changed, regenerating")
+        state = None
+    if state is not None:
+        if state["commit"] == commit:
+            print(f">> Already up to date with {commit}")
+            write_report(output_dir, git_info, started, {})
+            return unresolved_types(paths, state["modules"])
+        changed = changed_paths(docs_path, state["commit"])
+        if changed is None:
+            print(f">> Can't diff against {state['commit']}, regenerating everything")
+
+    if changed is None:
+        modules = {}
+        docs, report = run(paths, output_dir, git_info, **kwargs)
+    else:
+        modules = state["modules"]
+        # Docs that were removed count as changed too
+        touched = {basename(path) for path in paths if path in changed}
+        touched |= set(modules) - current
+        print(f">> {len(touched)} docs changed since {state['commit']}")
+        docs, report = run(
+            [path for path in paths if basename(path) in touched],
+            output_dir,
+            git_info,
+            known=known_symbols(paths, modules, exclude=touched),
+            **kwargs,
+        )
+
+    old_modules = dict(modules)
+    for module in set(modules) - {basename(path) for path in paths}:
+        del modules[module]
+    for module, info in docs.items():
+        modules[module] = {
+            "defines": info["defines"],
+            "references": info["references"],
+            "kinds": info["kinds"],
+            "unresolved": modules.get(module, {}).get("unresolved", []),
+        }
+
+    if changed is not None:
+        # Re-emit anything that points at a structure whose definition moved,
+        # changed or went away. Check both the old and new definitions.
+        affected = dependents(old_modules, touched) | dependents(modules, touched)
+        affected = [path for path in paths if basename(path) in affected]
+        if affected:
+            print(f">> Re-emitting {len(affected)} dependent modules")
+            dependent_docs, dependent_report = run(
+                affected,
+                output_dir,
+                git_info,
+                emit_only=set(affected),
+                known=known_symbols(paths, modules),
+                **kwargs,
+            )
+            docs.update(dependent_docs)
+            report.update(dependent_report)
+
+    # Types are checked as they're emitted. Whatever didn't resolve is kept
+    # with the module so that incremental runs still report all of it.
+    for module, entry in report.items():
+        if module in modules:
+            modules[module]["unresolved"] = sorted(
+                {
+                    tuple(unresolved)
+                    for metrics in entry["emit"].values()
+                    for unresolved in metrics.get("unresolved", [])
+                }
+            )
+
+    save_state(output_dir, commit, code, targets, kwargs["settings"], modules)
+    write_report(output_dir, git_info, started, report)
+    write_manifest(output_dir, git_info, docs, report)
+    return unresolved_types(paths, modules)
+
+
+def watch_docs(docs_path, output_dir, git_info, poll_interval=watch.poll_interval):
+    # Re-parses docs as they change on disk and re-emits them along with every
+    # module referencing them. It all happens in this one process, so that the
+    # type rules, the type registries and their caches stay warm from one edit
+    # to the next. Picks up where the regenerate into `output_dir` that has
+    # to come first left off, and keeps its state up to date.
+    state = load_state(output_dir)
+    targets = state["targets"]
+    modules = state["modules"]
+    docs = {}
+    blobs = {}
+    for module in modules:
+        with open(os.path.join(output_dir, module + ".json")) as f:
+            text = f.read()
+        document = ir.loads(module, text)
+        docs[module] = doc_info(document, text)
+        blobs[module] = ir.pack(document)
+
+    dirs = [os.path.join(docs_path, path) for path in watched_dirs]
+    for changed in watch.changes(dirs, poll_interval):
+        started = time.perf_counter()
+        paths = doc_paths(docs_path)
+        sources = {basename(path): path for path in paths}
+        touched = {
+            basename(path)
+            for path in changed
+            if path.endswith(".md") and (path in paths or basename(path) in modules)
+        }
+        if not touched:
+            continue
+
+        old_modules = {module: dict(entry) for module, entry in modules.items()}
+        position = {module: k for k, module in enumerate(sources)}
+        report = {}
+        for module in sorted(touched, key=lambda m: position.get(m, len(paths))):
+            if module not in sources:
+                print(f">> Removing {module}")
+                remove_outputs(output_dir, targets, module)
+                for table in (modules, docs, blobs):
+                    table.pop(module, None)
+                continue
+            (blob, info), log, metrics = parse_doc(sources[module], output_dir)
+            print(f">> Processing file: {sources[module]}")
+            sys.stdout.flush()
+            sys.stderr.write(log)
+            if info["digest"] == docs.get(module, {}).get("digest"):
+                touched.discard(module)
+                continue
+            docs[module] = info
+            blobs[module] = blob
+            modules[module] = {
+                "defines": info["defines"],
+                "references": info["references"],
+            "kinds": info["kinds"],
+                "unresolved": modules.get(module, {}).get("unresolved", []),
+            }
+            report[module] = {"source": sources[module], "parse": metrics}
+        if not touched:
+            print(">> Nothing changed")
+            sys.stdout.flush()
+            continue
+
+        affected = touched | dependents(old_modules, touched)
+        affected |= dependents(modules, touched)
+        ir.define_symbols(known_symbols(paths, modules), replace=True)
+        for path in paths:
+            module = basename(path)
+            if module not in affected or module not in blobs:
+                continue
+            report.setdefault(module, {"source": path})["emit"] = {}
+            unresolved = set()
+            for target, (out, log, metrics) in emit_doc(
+                blobs[module], git_info, targets
+            ).items():
+                target_file = target_path(output_dir, target, module)
+                changed = ir.write(target_file, out)
+                note = "" if changed else " (unchanged)"
+                label = ir.emitters[target].label
+                print(f">> Processing JSON -> {label}: {target_file}{note}")
+                sys.stdout.flush()
+                sys.stderr.write(log)
+                report[module]["emit"][target] = dict(
+                    metrics,
+                    cached=False,
+                    changed=changed,
+                    sha256=hashlib.sha256(out.encode("utf-8")).hexdigest(),
+                )
+                unresolved.update(map(tuple, metrics["unresolved"]))
+            modules[module]["unresolved"] = sorted(unresolved)
+
+        save_state(
+            output_dir,
+            state["commit"],
+            state.get("code"),
+            targets,
+            state["settings"],
+            modules,
+        )
+        write_manifest(output_dir, git_info, docs, report)
+        unresolved = unresolved_types(paths, modules)
+        if unresolved:
+            ir.print_unresolved(unresolved)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f">> Regenerated {len(report)} docs in {elapsed:.0f}ms")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("docs_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("git_info")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only regenerate docs changed since the last run",
+    )
+    parser.add_argument(
+        "--target",
+        action="append",
+        dest="targets",
+        help="code to generate, can be given more than once (default: elixir)",
+    )
+    parser.add_argument(
+        "--plugin",
+        action="append",
+        dest="plugins",
+        default=[],
+        help="module to import for extra emitters, see ir.py",
+    )
+    parser.add_argument(
+        "--snowflake-integers",
+        action="store_true",
+        help="type snowflakes as integers in the Elixir, parsed in create/1",
+    )
+    parser.add_argument(
+        "--atom-enums",
+        action="store_true",
+        help="decode fields typed as an enum into atoms in create/1",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="keep timings, times and the docs commit out of the generated code, "
+        "they go in manifest.json instead",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and regenerate docs as they're edited",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=watch.poll_interval,
+        help="seconds between checks for changes, for --watch without inotify",
+    )
+    parser.add_argument("-j", "--jobs", type=int, help="defaults to the CPU count")
+    parser.add_argument(
+        "--type-rules", help="JSON file of extra clarify_type rules, see process.py"
+    )
+    parser.add_argument("--cache-dir", default=cache.default_dir)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument(
+        "--cache-max-bytes", type=int, default=cache.default_max_bytes
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=int,
+        default=cache.default_max_age,
+        help="in seconds",
+    )
+    args = parser.parse_args()
+    ir.load_plugins(args.plugins)
+    targets = list(dict.fromkeys(args.targets or ["elixir"]))
+    for target in targets:
+        if target not in ir.emitters:
+            parser.error(
+                f"unknown target {target}, have: {', '.join(sorted(ir.emitters))}"
+            )
+
+    unresolved = regenerate(
+        args.docs_path,
+        args.output_dir,
+        args.git_info,
+        incremental=args.incremental,
+        targets=targets,
+        plugins=args.plugins,
+        snowflake_integers=args.snowflake_integers,
+        atom_enums=args.atom_enums,
+        deterministic=args.deterministic,
+        workers=args.jobs,
+        type_rules=args.type_rules,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes,
+        cache_max_age=args.cache_max_age,
+    )
+    if unresolved:
+        ir.print_unresolved(unresolved)
+    if args.watch:
+        try:
+            watch_docs(
+                args.docs_path, args.output_dir, args.git_info, args.poll_interval
+            )
+        except KeyboardInterrupt:
+            pass
+    elif unresolved:
+        sys.exit(1)
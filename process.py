@@ -1,12 +1,14 @@
 #!/usr/bin/env python
 
+from collections import Counter
+import functools
 import json
+import os
 import re
 import sys
 import xml.etree.ElementTree as ET
 
-data = sys.stdin.readlines()
-root = ET.fromstring("".join(data))
+from extract import extract
 
 skippable_sections = [
     "Gateway Payload Structure",
@@ -37,8 +39,15 @@ skippable_sections = [
     "Bot Auth Parameters",
 ]
 
-last = None
-table = {}
+# Running totals for whoever's interested (pipeline.py's report); reset them
+# between docs to get per-doc numbers.
+counters = Counter()
+warnings = Counter()
+
+
+def warn(category, *message):
+    warnings[category] += 1
+    print(*message, file=sys.stderr)
 
 
 def full_text(tag):
@@ -65,6 +74,120 @@ def snake(s):
     return s.replace(" ", "_").replace("-", "_").lower()
 
 
+# Type overrides for specific sections, checked before the global ones below.
+# section -> {type in the docs -> type in the JSON}
+section_type_overrides = {
+    "activity_structure": {
+        "timestamps object": "activity_timestamps_structure",
+        "party object": "activity_party_structure",
+        "assets object": "activity_assets_structure",
+        "secrets object": "activity_secrets_structure",
+    },
+    "message_structure": {
+        "message activity object": "message_activity_structure",
+        "message application object": "message_application_structure",
+        "message_reference object": "message_reference_structure",
+    },
+    "integration_structure": {"account object": "integration_account_structure"},
+    "ready_event_structure": {"array": "array<any>"},
+    "gateway_status_update_structure": {"activity object": "activity_structure"},
+    "presence_update_event_structure": {"activity object": "activity_structure"},
+    "guild_request_members_structure": {
+        "snowflake or array of snowflakes": "snowflake | array<snowflake>",
+    },
+    "audit_log_change_structure": {"mixed": "any"},
+    "audit_log_change_key": {
+        "integer (channel type) or string": "channel_types_enum | string",
+    },
+    "audit_log_entry_structure": {
+        "audit log event": "audit_log_events_enum",
+        "optional audit entry info": "optional_audit_entry_info_structure",
+    },
+    "connection_structure": {"array": "array<any>"},
+    "guild_emojis_update_event_structure": {"array": "array<emoji_structure>"},
+}
+
+# Fields the docs type as a plain primitive that are really one of the enums,
+# matched on the field's name rather than its type.
+# section -> {field -> type in the JSON}
+section_field_types = {
+    "channel_structure": {"type": "channel_types_enum"},
+    "message_structure": {"type": "message_types_enum"},
+}
+
+# Same as the section overrides, but matching on prefixes.
+# section -> [(prefix, type in the JSON)]
+section_type_prefixes = {
+    "ready_event_structure": [("array of two integers", "array<integer>")],
+}
+
+# Only applies to sections that don't have any overrides of their own
+unknown_section_type_overrides = {
+    "gateway_status_update_structure": "presence_structure",
+}
+
+global_type_overrides = {
+    "snowflake or array of snowflakes": "snowflake | array<snowflake>",
+    "emoji object": "emoji_structure",
+    "user object": "user_structure",
+    "guild member object": "guild_member_structure",
+    "member object": "guild_member_structure",
+    "member": "guild_member_structure",
+    "ISO8601 timestamp": "timestamp",
+    "a role object": "role_structure",
+    "a user object": "user_structure",
+    "int": "integer",
+    "client_status object": "client_status_structure",
+    "welcome screen object": "welcome_screen_structure",
+    # This *shouldn't* fall under the caveats listed below
+    "partial guild member object": "guild_member_structure",
+    "role tags object": "map",
+    "application object": "application_object_structure",
+    "team object": "team_structure",
+    "message reference": "message_reference_structure",
+    "message reference object": "message_reference_structure",
+    "message object": "message_structure",
+    "message interaction object": "message_interaction_structure",
+}
+
+# For "array of ..." types, after the element type has been snaked and had
+# _structure stuck onto the end of it
+array_element_overrides = {
+    "role_object_ids_structure": "snowflake",
+    "strings_structure": "string",
+    "guild_feature_strings_structure": "string",
+    "snowflake_structure": "snowflake",
+    "snowflakes_structure": "snowflake",
+    "Unavailable_Guild_structure": "unavailable_guild_structure",
+}
+
+array_objects_re = re.compile(r"objects.*$")
+
+
+def load_type_rules(path):
+    # Merges the rules in a JSON file into the tables above. The file looks
+    # like {"sections": {...}, "section_prefixes": {...}, "fields": {...},
+    # "unknown_sections": {...}, "global": {...}, "array_elements": {...}},
+    # with every key optional.
+    with open(path) as f:
+        rules = json.load(f)
+    for section, overrides in rules.get("sections", {}).items():
+        section_type_overrides.setdefault(section, {}).update(overrides)
+    for section, prefixes in rules.get("section_prefixes", {}).items():
+        # Loading the same file twice shouldn't add anything
+        known = section_type_prefixes.setdefault(section, [])
+        known.extend(
+            [tuple(prefix) for prefix in prefixes if tuple(prefix) not in known]
+        )
+    for section, fields in rules.get("fields", {}).items():
+        section_field_types.setdefault(section, {}).update(fields)
+    unknown_section_type_overrides.update(rules.get("unknown_sections", {}))
+    global_type_overrides.update(rules.get("global", {}))
+    array_element_overrides.update(rules.get("array_elements", {}))
+    clarify_type.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
 def clarify_type(t, section=None):
     t = (
         t.replace("?", "")
@@ -74,134 +197,34 @@ def clarify_type(t, section=None):
         .replace(".", "_")
     )
     if section is not None:
-        if section == "activity_structure":
-            if t == "timestamps object":
-                return "activity_timestamps_structure"
-            elif t == "party object":
-                return "activity_party_structure"
-            elif t == "assets object":
-                return "activity_assets_structure"
-            elif t == "secrets object":
-                return "activity_secrets_structure"
-        elif section == "channel_structure":
-            if t == "type":
-                return "channel_types_enum"
-        elif section == "message_structure":
-            if t == "type":
-                return "message_types_enum"
-            elif t == "message activity object":
-                return "message_activity_structure"
-            elif t == "message application object":
-                return "message_application_structure"
-            elif t == "message_reference object":
-                return "message_reference_structure"
-        elif section == "integration_structure":
-            if t == "account object":
-                return "integration_account_structure"
-        elif section == "ready_event_structure":
-            if t.startswith("array of two integers"):
-                return "array<integer>"
-            elif t == "array":
-                return "array<any>"
-        elif section == "gateway_status_update_structure":
-            if t == "activity object":
-                return "activity_structure"
-        elif section == "presence_update_event_structure":
-            if t == "activity object":
-                return "activity_structure"
-        elif section == "guild_request_members_structure":
-            if t == "snowflake or array of snowflakes":
-                return "snowflake | array<snowflake>"
-        elif section == "audit_log_change_structure":
-            if t == "mixed":
-                return "any"
-        elif section == "audit_log_change_key":
-            if t == "integer (channel type) or string":
-                return "channel_types_enum | string"
-        elif section == "audit_log_entry_structure":
-            if t == "audit log event":
-                return "audit_log_events_enum"
-            elif t == "optional audit entry info":
-                return "optional_audit_entry_info_structure"
-        elif section == "connection_structure":
-            if t == "array":
-                return "array<any>"
-        elif section == "guild_emojis_update_event_structure":
-            if t == "array":
-                return "array<emoji_structure>"
-        else:
-            if t == "gateway_status_update_structure":
-                return "presence_structure"
-            return clarify_type(t)
-    if t == "snowflake or array of snowflakes":
-        return "snowflake | array<snowflake>"
-    elif t == "emoji object":
-        return "emoji_structure"
-    elif t == "user object":
-        return "user_structure"
-    elif t == "guild member object" or t == "member object" or t == "member":
-        return "guild_member_structure"
+        if section in section_type_overrides or section in section_type_prefixes:
+            overrides = section_type_overrides.get(section, {})
+            if t in overrides:
+                return overrides[t]
+            for prefix, type_ in section_type_prefixes.get(section, []):
+                if t.startswith(prefix):
+                    return type_
+        elif t in unknown_section_type_overrides:
+            return unknown_section_type_overrides[t]
+        # Yes, this is actually needed as a final catch-all
+        return clarify_type(t)
+
+    if t in global_type_overrides:
+        return global_type_overrides[t]
     elif t.startswith("array of"):
-        cleaned = re.sub(r"objects.*$", "", t.replace("array of", "")).strip()
-        snaked = snake(cleaned)
-        type_name = f"{snaked}_structure"
-        if type_name == "role_object_ids_structure":
-            type_name = "snowflake"
-        elif type_name == "strings_structure":
-            type_name = "string"
-        elif type_name == "guild_feature_strings_structure":
-            type_name = "string"
-        elif type_name == "snowflake_structure" or type_name == "snowflakes_structure":
-            type_name = "snowflake"
-        elif type_name == "Unavailable_Guild_structure":
-            type_name = type_name.lower()
-        return f"array<{type_name}>"
+        cleaned = array_objects_re.sub("", t.replace("array of", "")).strip()
+        type_name = f"{snake(cleaned)}_structure"
+        return f"array<{array_element_overrides.get(type_name, type_name)}>"
     elif t.startswith("embed ") and t.endswith(" object"):
         return t.replace(" ", "_").replace("object", "structure")
-    elif t == "ISO8601 timestamp":
-        return "timestamp"
-    elif t == "a role object":
-        return "role_structure"
-    elif t == "a user object":
-        return "user_structure"
-    elif t == "int":
-        return "integer"
-    elif t == "client_status object":
-        return "client_status_structure"
-    elif t == "welcome screen object":
-        return "welcome_screen_structure"
-    elif t == "partial guild member object":
-        # This *shouldn't* fall under the caveats listed below
-        return "guild_member_structure"
     elif (
-        (
-            (t.startswith("partial ") or t.startswith("a partial "))
-            and (t.endswith(" object") or t.endswith(" structure"))
-        )
-        or t == "role tags object"
-        or "integration" in t
-    ):
+        t.startswith(("partial ", "a partial "))
+        and t.endswith((" object", " structure"))
+    ) or "integration" in t:
         # The docs contain a TON of stuff that doesn't exactly specify types in
         # a manner that can be easily parsed out. In that case, we just call it
         # a plain map and move on.
         return "map"
-    elif t == "partial presence update structure":
-        return "partial_presence_update_structure"
-    elif t == "application object":
-        return "application_object_structure"
-    elif t == "team object":
-        return "team_structure"
-    elif t == "message reference" or t == "message reference object":
-        return "message_reference_structure"
-    elif t == "message object":
-        return "message_structure"
-    elif t == "message interaction object":
-        return "message_interaction_structure"
-    else:
-        return t
-    # Yes, this is actually needed as a final catch-all
-    if section is not None:
-        return clarify_type(t)
     else:
         return t
 
@@ -245,7 +268,8 @@ def is_actually_enum(name):
         "premium_types_structure",
         "verification_level_structure",
         "bitwise_permission_flags",
-        "system_channel_flags",
+        "system_channel_flags_structure",
+        "audit_log_events_structure",
         "guild_features",
         "allowed_mention_types",
         "allowed_mention_types_structure",
@@ -253,302 +277,364 @@ def is_actually_enum(name):
     ]
 
 
-for child in root:
-    if child.tag == "h3" and "Application Object" in child.text:
-        last = "Application"
-    if child.tag == "h6" and child.text not in [
-        "System Channel Flags",
-        "Guild Features",
-        "Audit Log Structure",
-        "Audit Log Events",
-        "Voice State Structure",
-        "Voice Region Structure",
-        "Allowed Mentions Structure",
-        "Channel Mention Structure",
-        "Welcome Screen Structure",
-        "Presence Update Event Fields",
-        "Gateway Status Update Structure",
-        "Status Types",
-        "Welcome Screen Structure",
-        "Welcome Screen Channel Structure",
-        "Webhook Execution URL",
-    ]:
-        if last is None:
-            last = child.text
+def iter_elements(stream, chunk_size=64 * 1024):
+    # Incrementally parses the HTML on `stream`, yielding each top-level
+    # element (ie. each h6/table) as soon as it's closed. Once the caller is
+    # done with an element it's dropped, so memory stays flat no matter how
+    # large the input is.
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    depth = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            parser.feed(chunk)
         else:
-            print(
-                "Warning: Setting last to",
-                child.text,
-                "but it was never reset from",
-                last,
-                file=sys.stderr,
-            )
-            last = child.text
-    elif child.tag == "table":
-        if last is None:
-            # If we hit a table we don't recognize, we try to traverse it to
-            # figure out if we can recognize it. We do this immediately, then
-            # have another `last is None` check to make sure that it actually
-            # is none and not something we had to guess from heuristics.
-            client_status_keys_found = []
-            client_status_keys_expected = ["desktop?", "web?", "mobile?"]
-
-            guild_feature_keys_found = []
-            guild_feature_keys_expected = ["PARTNERED"]
-
-            status_update_keys_found = []
-            status_update_keys_expected = ["since", "status", "activities", "afk"]
-
-            status_type_keys_found = []
-            status_type_keys_expected = [
-                "online",
-                "dnd",
-                "idle",
-                "invisible",
-                "offline",
-            ]
-
-            welcome_screen_keys_found = []
-            welcome_screen_keys_expected = ["description", "welcome_channels"]
-
-            welcome_channels_keys_found = []
-            welcome_channels_keys_expected = ["channel_id", "emoji_id", "emoji_name"]
-
-            application_keys_found = []
-            application_keys_expected = ["verify_key"]
-
-            for t in child:
-                if t.tag == "tbody":
-                    for tr in t:
-                        for x in tr:
-                            xt = x.text
-                            if xt in client_status_keys_expected:
-                                client_status_keys_found.append(xt)
-                            elif xt in guild_feature_keys_expected:
-                                guild_feature_keys_found.append(xt)
-                            elif xt in status_update_keys_expected:
-                                status_update_keys_found.append(xt)
-                            elif xt in status_type_keys_expected:
-                                status_type_keys_found.append(xt)
-                            elif xt in welcome_screen_keys_expected:
-                                welcome_screen_keys_found.append(xt)
-                            elif xt in welcome_channels_keys_expected:
-                                welcome_channels_keys_found.append(xt)
-                            elif xt in application_keys_expected:
-                                application_keys_found.append(xt)
-
-            def fits(a, b):
-                return set(a) == set(b)
-
-            if fits(client_status_keys_found, client_status_keys_expected):
-                # Not an accurate name, but it's Close Enough:tm: and should
-                # get it to generate correctly for us
-                last = "Client Status Structure"
-            elif fits(guild_feature_keys_found, guild_feature_keys_expected):
-                last = "Guild Features"
-            elif fits(status_update_keys_found, status_update_keys_expected):
-                last = "Gateway Status Update Structure"
-            elif fits(status_type_keys_found, status_type_keys_expected):
-                last = "Status Types"
-            elif fits(welcome_screen_keys_found, welcome_screen_keys_expected):
-                last = "Welcome Screen Structure"
-            elif fits(welcome_channels_keys_found, welcome_channels_keys_expected):
-                last = "Welcome Screen Channel Structure"
-            elif fits(application_keys_found, application_keys_expected):
-                last = "Application"
-
-        if last is None:
-            print(
-                f"Warning: Skipping unknown table due to no last header.",
-                file=sys.stderr,
-            )
-            last = None
-        elif last not in skippable_sections:
-            last = last.strip()
-            # print("Processing section:", last, file=sys.stderr)
-            col_count = 0
-            for table_chunk in child:
-                if table_chunk.tag == "thead":
-                    for header_row in table_chunk:
-                        for header_col in header_row:
-                            col_count += 1
-                elif table_chunk.tag == "tbody":
-                    # Name | Value
-                    # Field | Type | Description
-                    rows = list(table_chunk)
-                    struct = {}
-                    section_name = fix_struct_name(
-                        last.lower().replace(" ", "_"), cols=col_count
-                    )
-                    enum = False
-                    if col_count == 3 or col_count == 4:
-                        if is_actually_enum(section_name):
-                            # This is an enum, but we can't autodetect that.
-                            enum = True
-                            section_name = fix_struct_name(
-                                last.lower().replace(" ", "_"), cols=2
-                            )
-                    if "json" not in section_name:
-                        for row in rows:
-                            cols = list(row)
-                            if col_count == 2:
-                                if last == "User Flags" or last == "Premium Types":
-                                    name = snake(full_text(cols[1]))
-                                    value = full_text(cols[0])
-                                    struct[name] = value
-                                elif (
-                                    last == "Premium Types"
-                                    or last == "Visibility Types"
-                                ):
-                                    name = snake(cols[1].text).strip()
-                                    value = cols[0].text.strip()
-                                    desc = full_text(cols[2])
-                                    struct[name] = {"value": value, "desc": desc}
-                                    pass
-                                elif last == "Guild Features":
-                                    name = cols[0].text.strip()
-                                    value = cols[0].text.strip()
-                                    desc = cols[1].text.strip()
-                                    struct[name] = {"value": value, "desc": desc}
-                                else:
-                                    name = cols[0].text.strip().replace(".", "_")
-                                    value = cols[1].text.strip()
-                                    struct[name] = value
-                            elif col_count == 3:
-                                # print("LAST = " + last, file=sys.stderr)
-                                name = cols[0].text.strip()
-                                # Make hyperlinks inside of types work
-                                type_ = full_text(cols[1])
-                                desc = full_text(cols[2])
-                                real_name = (
-                                    name.replace("?", "")
-                                    .replace("*", "")
-                                    .strip()
-                                    .replace(" ", "_")
-                                )
-                                real_name = real_name.upper() if enum else real_name
-                                real_type = type_.replace("?", "").strip()
-                                struct[real_name] = dict_concat(
-                                    {
-                                        ("value" if enum else "type"): deunicode(
-                                            clarify_type(
-                                                real_type, section=section_name
-                                            )
-                                        ),
-                                        "desc": ""
-                                        if desc is None
-                                        else deunicode(desc.strip()),
-                                    },
-                                    typeinfo(name, type_),
+            parser.close()
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield elem
+                    elem.clear()
+                    root.remove(elem)
+        if not chunk:
+            break
+
+
+# Tables that don't have an h6 in front of them get recognized by the keys in
+# their first column instead. Keys can only belong to one signature.
+# frozenset of keys -> section name
+table_signatures = {}
+# key -> the signature it's part of
+signature_index = {}
+
+
+def register_table_signature(keys, section):
+    signature = frozenset(keys)
+    for key in signature:
+        if signature_index.get(key, signature) != signature:
+            raise ValueError(f"Key {key!r} is already part of another signature")
+    table_signatures[signature] = section
+    for key in signature:
+        signature_index[key] = signature
+
+
+# Not an accurate name, but it's Close Enough:tm: and should get it to generate
+# correctly for us
+register_table_signature(["desktop?", "web?", "mobile?"], "Client Status Structure")
+register_table_signature(["PARTNERED"], "Guild Features")
+register_table_signature(
+    ["since", "status", "activities", "afk"], "Gateway Status Update Structure"
+)
+register_table_signature(
+    ["online", "dnd", "idle", "invisible", "offline"], "Status Types"
+)
+register_table_signature(
+    ["description", "welcome_channels"], "Welcome Screen Structure"
+)
+register_table_signature(
+    ["channel_id", "emoji_id", "emoji_name"], "Welcome Screen Channel Structure"
+)
+register_table_signature(["verify_key"], "Application")
+
+
+def classify_table(table):
+    # One pass over the first column, then the table is whatever signature
+    # had all of its keys show up.
+    found = {}
+    for t in table:
+        if t.tag == "tbody":
+            for tr in t:
+                if len(tr) == 0:
+                    continue
+                key = tr[0].text
+                signature = signature_index.get(key)
+                if signature is not None:
+                    found.setdefault(signature, set()).add(key)
+    for signature, keys in found.items():
+        if keys == signature:
+            return table_signatures[signature]
+    return None
+
+
+def process(elements):
+    # `elements` is anything that yields the top-level h6/table elements, ie.
+    # the <div> root itself, iter_elements(...) or extract(...).
+    last = None
+    table = {}
+
+    for child in elements:
+        if child.tag == "h3" and "Application Object" in child.text:
+            last = "Application"
+        if child.tag == "h6" and child.text not in [
+            "Guild Features",
+            "Audit Log Structure",
+            "Voice State Structure",
+            "Voice Region Structure",
+            "Allowed Mentions Structure",
+            "Channel Mention Structure",
+            "Welcome Screen Structure",
+            "Presence Update Event Fields",
+            "Gateway Status Update Structure",
+            "Status Types",
+            "Welcome Screen Structure",
+            "Welcome Screen Channel Structure",
+            "Webhook Execution URL",
+        ]:
+            if last is None:
+                last = child.text
+            else:
+                warn(
+                    "header_not_reset",
+                    "Warning: Setting last to",
+                    child.text,
+                    "but it was never reset from",
+                    last,
+                )
+                last = child.text
+        elif child.tag == "table":
+            counters["tables"] += 1
+            if last is None:
+                # If we hit a table we don't recognize, we try to traverse it to
+                # figure out if we can recognize it. We do this immediately, then
+                # have another `last is None` check to make sure that it actually
+                # is none and not something we had to guess from heuristics.
+                last = classify_table(child)
+
+            if last is None:
+                warn(
+                    "unknown_table",
+                    f"Warning: Skipping unknown table due to no last header.",
+                )
+                last = None
+            elif last not in skippable_sections:
+                last = last.strip()
+                # print("Processing section:", last, file=sys.stderr)
+                col_count = 0
+                for table_chunk in child:
+                    if table_chunk.tag == "thead":
+                        for header_row in table_chunk:
+                            for header_col in header_row:
+                                col_count += 1
+                    elif table_chunk.tag == "tbody":
+                        # Name | Value
+                        # Field | Type | Description
+                        rows = list(table_chunk)
+                        struct = {}
+                        section_name = fix_struct_name(
+                            last.lower().replace(" ", "_"), cols=col_count
+                        )
+                        enum = False
+                        if col_count == 3 or col_count == 4:
+                            if is_actually_enum(section_name):
+                                # This is an enum, but we can't autodetect that.
+                                enum = True
+                                section_name = fix_struct_name(
+                                    last.lower().replace(" ", "_"), cols=2
                                 )
-                            elif col_count == 4:
-                                if last == "Activity Types":
-                                    # This is an enum, but we can't autodetect that.
-                                    section_name = fix_struct_name(
-                                        last.lower().replace(" ", "_"), cols=2
-                                    )
-                                    # ID | Name | Format | Example
-                                    id_ = cols[0].text.strip()
-                                    name = cols[1].text.strip()
-                                    format_ = cols[2].text.strip()
-                                    example = deunicode(cols[3].text).strip()
-                                    struct[snake(name)] = {
-                                        "value": id_,
-                                        "desc": f"{format_} - {example}",
-                                    }
-                                elif last == "Optional Audit Entry Info":
-                                    # Field | Type | Description | Action type
-                                    field = cols[0].text.strip()
-                                    type_ = full_text(cols[1])
-                                    desc = deunicode(full_text(cols[2]))
-                                    action_type = cols[3].text.strip()
-                                    struct[field] = dict_concat(
-                                        {
-                                            "type": clarify_type(type_),
-                                            "desc": desc,
-                                            "action_type": action_type,
-                                        },
-                                        typeinfo(field, type_),
-                                    )
-                                elif last == "Audit Log Change Key":
-                                    # Name | Object changed | Type | Description
+                        if "json" not in section_name:
+                            for row in rows:
+                                cols = list(row)
+                                if col_count == 2:
+                                    if last == "User Flags" or last == "Premium Types":
+                                        name = snake(full_text(cols[1]))
+                                        value = full_text(cols[0])
+                                        struct[name] = value
+                                    elif (
+                                        last == "Premium Types"
+                                        or last == "Visibility Types"
+                                    ):
+                                        name = snake(cols[1].text).strip()
+                                        value = cols[0].text.strip()
+                                        desc = full_text(cols[2])
+                                        struct[name] = {"value": value, "desc": desc}
+                                        pass
+                                    elif last == "Guild Features":
+                                        name = cols[0].text.strip()
+                                        value = cols[0].text.strip()
+                                        desc = cols[1].text.strip()
+                                        struct[name] = {"value": value, "desc": desc}
+                                    else:
+                                        name = cols[0].text.strip().replace(".", "_")
+                                        value = cols[1].text.strip()
+                                        struct[name] = value
+                                elif col_count == 3:
+                                    # print("LAST = " + last, file=sys.stderr)
                                     name = cols[0].text.strip()
-                                    object_changed = full_text(cols[1])
-                                    type_ = full_text(cols[2])
-                                    desc = deunicode(full_text(cols[3]))
-                                    struct[name] = dict_concat(
-                                        {
-                                            "object_changed": object_changed,
-                                            "type": clarify_type(type_),
-                                            "desc": desc,
-                                        },
-                                        typeinfo(name, type_),
-                                    )
-                                elif last == "User Structure":
-                                    # Field | Type | Description | Required OAuth scope
-                                    field = (
-                                        cols[0]
-                                        .text.replace("?", "")
+                                    # Make hyperlinks inside of types work
+                                    type_ = full_text(cols[1])
+                                    desc = full_text(cols[2])
+                                    real_name = (
+                                        name.replace("?", "")
                                         .replace("*", "")
                                         .strip()
+                                        .replace(" ", "_")
                                     )
-                                    type_ = full_text(cols[1])
-                                    desc = deunicode(full_text(cols[2]))
-                                    oauth_scope = full_text(cols[3])
-                                    struct[field] = dict_concat(
+                                    real_name = real_name.upper() if enum else real_name
+                                    real_type = type_.replace("?", "").strip()
+                                    real_type = deunicode(
+                                        clarify_type(real_type, section=section_name)
+                                    )
+                                    if not enum:
+                                        real_type = section_field_types.get(
+                                            section_name, {}
+                                        ).get(real_name, real_type)
+                                    struct[real_name] = dict_concat(
                                         {
-                                            "type": clarify_type(type_),
-                                            "desc": desc,
-                                            "oauth_scope": oauth_scope,
+                                            ("value" if enum else "type"): real_type,
+                                            "desc": ""
+                                            if desc is None
+                                            else deunicode(desc.strip()),
                                         },
-                                        typeinfo(field, type_),
+                                        typeinfo(name, type_),
                                     )
-                                elif last == "Bitwise Permission Flags":
-                                    name = full_text(cols[0]).replace("*", "")
-                                    value = full_text(cols[1])
-                                    description = full_text(cols[2])
-                                    channel_types = (cols[3].text or "").strip()
-                                    struct[name] = {
-                                        "value": value,
-                                        "description": description,
-                                        "channel_types": channel_types,
-                                    }
-                                elif last == "Guild Request Members Structure":
-                                    field = full_text(cols[0]).replace("?", "").strip()
-                                    type_ = full_text(cols[1])
-                                    description = full_text(cols[2])
-                                    optional = full_text(cols[3]) == "true"
-                                    struct[field] = {
-                                        "type": clarify_type(type_),
-                                        "desc": description,
-                                        "optional": full_text(cols[0]).endswith("?"),
-                                        "nullable": not optional,
-                                    }
+                                elif col_count == 4:
+                                    if last == "Activity Types":
+                                        # This is an enum, but we can't autodetect that.
+                                        section_name = fix_struct_name(
+                                            last.lower().replace(" ", "_"), cols=2
+                                        )
+                                        # ID | Name | Format | Example
+                                        id_ = cols[0].text.strip()
+                                        name = cols[1].text.strip()
+                                        format_ = cols[2].text.strip()
+                                        example = deunicode(cols[3].text).strip()
+                                        struct[snake(name)] = {
+                                            "value": id_,
+                                            "desc": f"{format_} - {example}",
+                                        }
+                                    elif last == "Optional Audit Entry Info":
+                                        # Field | Type | Description | Action type
+                                        field = cols[0].text.strip()
+                                        type_ = full_text(cols[1])
+                                        desc = deunicode(full_text(cols[2]))
+                                        action_type = cols[3].text.strip()
+                                        struct[field] = dict_concat(
+                                            {
+                                                "type": clarify_type(type_),
+                                                "desc": desc,
+                                                "action_type": action_type,
+                                            },
+                                            typeinfo(field, type_),
+                                        )
+                                    elif last == "Audit Log Change Key":
+                                        # Name | Object changed | Type | Description
+                                        name = cols[0].text.strip()
+                                        object_changed = full_text(cols[1])
+                                        type_ = full_text(cols[2])
+                                        desc = deunicode(full_text(cols[3]))
+                                        struct[name] = dict_concat(
+                                            {
+                                                "object_changed": object_changed,
+                                                "type": clarify_type(type_),
+                                                "desc": desc,
+                                            },
+                                            typeinfo(name, type_),
+                                        )
+                                    elif last == "User Structure":
+                                        # Field | Type | Description | Required OAuth scope
+                                        field = (
+                                            cols[0]
+                                            .text.replace("?", "")
+                                            .replace("*", "")
+                                            .strip()
+                                        )
+                                        type_ = full_text(cols[1])
+                                        desc = deunicode(full_text(cols[2]))
+                                        oauth_scope = full_text(cols[3])
+                                        struct[field] = dict_concat(
+                                            {
+                                                "type": clarify_type(type_),
+                                                "desc": desc,
+                                                "oauth_scope": oauth_scope,
+                                            },
+                                            typeinfo(field, type_),
+                                        )
+                                    elif last == "Bitwise Permission Flags":
+                                        name = full_text(cols[0]).replace("*", "")
+                                        value = full_text(cols[1])
+                                        description = full_text(cols[2])
+                                        channel_types = (cols[3].text or "").strip()
+                                        struct[name] = {
+                                            "value": value,
+                                            "description": description,
+                                            "channel_types": channel_types,
+                                        }
+                                    elif last == "Guild Request Members Structure":
+                                        field = (
+                                            full_text(cols[0]).replace("?", "").strip()
+                                        )
+                                        type_ = full_text(cols[1])
+                                        description = full_text(cols[2])
+                                        optional = full_text(cols[3]) == "true"
+                                        struct[field] = {
+                                            "type": clarify_type(type_),
+                                            "desc": description,
+                                            "optional": full_text(cols[0]).endswith(
+                                                "?"
+                                            ),
+                                            "nullable": not optional,
+                                        }
+                                    else:
+                                        warn(
+                                            "unknown_4_column_section",
+                                            f"Warning: Unknown 4-column section: {last}",
+                                        )
                                 else:
-                                    print(
-                                        f"Warning: Unknown 4-column section: {last}",
-                                        file=sys.stderr,
+                                    warn(
+                                        "unknown_column_count",
+                                        f"Warning: Unknown column count: {col_count} (expected 2 - 4), section = {last}",
                                     )
-                            else:
-                                print(
-                                    f"Warning: Unknown column count: {col_count} (expected 2 - 4), section = {last}",
-                                    file=sys.stderr,
-                                )
 
-                        # NOTE: WE LITERALLY CANNOT USE fix_struct_name HERE!
-                        # It breaks the Elixir codegen somehow, idk why.
-                        # TODO: ??????????
-                        if section_name == "gateway_status_update_structure":
-                            section_name = "presence_structure"
-                        elif section_name == "team_object_structure":
-                            section_name = "team_structure"
-                        table[section_name] = struct
-                    else:
-                        print(
-                            f"Warning: Skipping json section: {last}", file=sys.stderr
-                        )
-        last = None
-    else:
-        print(f"Unknown tag: {child.tag}, last={last}", file=sys.stderr)
+                            # NOTE: WE LITERALLY CANNOT USE fix_struct_name HERE!
+                            # It breaks the Elixir codegen somehow, idk why.
+                            # TODO: ??????????
+                            if section_name == "gateway_status_update_structure":
+                                section_name = "presence_structure"
+                            elif section_name == "team_object_structure":
+                                section_name = "team_structure"
+                            elif section_name == "team_members_object_structure":
+                                section_name = "team_member_structure"
+                            table[section_name] = struct
+                            counters["fields"] += len(struct)
+                        else:
+                            warn(
+                                "json_section",
+                                f"Warning: Skipping json section: {last}",
+                            )
+            last = None
+        else:
+            warn("unknown_tag", f"Unknown tag: {child.tag}, last={last}")
+
+    return table
 
-print(json.dumps(table, indent=2))
+
+def process_file(path):
+    with open(path, encoding="utf-8") as f:
+        return process(extract(f.read()))
+
+
+def json_name(path):
+    return os.path.splitext(os.path.basename(path))[0].lower() + ".json"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        # process.py <output dir> <doc.md>...
+        # Processes every doc in one go, no pandoc/xmllint/xpath required.
+        output_dir = sys.argv[1]
+        for path in sys.argv[2:]:
+            print(f">> Processing file: {path}")
+            table = process_file(path)
+            with open(os.path.join(output_dir, json_name(path)), "w") as f:
+                f.write(json.dumps(table, indent=2) + "\n")
+    elif len(sys.argv) == 2:
+        print(json.dumps(process_file(sys.argv[1]), indent=2))
+    else:
+        # Legacy mode: pre-rendered HTML on stdin, JSON on stdout
+        print(json.dumps(process(iter_elements(sys.stdin)), indent=2))
@@ -1,21 +1,29 @@
 #!/usr/bin/env python
 
+from collections import Counter, namedtuple
 from datetime import datetime
+import functools
 import json
+import os
+import re
 import sys
 import time
 
+import ir
+
 
 def now():
     return int(round(time.time() * 1000))
 
 
-start = now()
+# Running totals, see process.py
+counters = Counter()
+warnings = Counter()
+
 
-stdin_lines = sys.stdin.readlines()
-stdin = "".join(stdin_lines)
-module = sys.argv[1]
-data = json.loads(stdin)
+def warn(category, *message):
+    warnings[category] += 1
+    print(*message, file=sys.stderr)
 
 
 def camel(snake):
@@ -43,337 +51,791 @@ def unquote(s):
     return s.replace("'", "").replace('"', "")
 
 
-def derive_type(t):
-    ts = t["type"]
-    optional = t["optional"]
-    nullable = t["nullable"]
-    res = ""
-    if ts == "boolean":
-        res += "boolean()"
-    elif ts == "string" or ts == "string (can be null only in reaction emoji objects)":
-        res += "String.t()"
-    elif ts == "snowflake":
-        res += "String.t()"
-    elif ts == "integer":
-        res += "integer()"
-    elif ts == "array":
-        res += "list()"
-    elif ts == "map":
-        res += "map()"
-    elif ts == "timestamp":
-        res += "String.t()"
-    elif ts == "any":
-        res += "term()"
-    elif ts == "snowflake | array<snowflake>":
-        res += "String.t() | [String.t()]"
-    elif ts == "activity_assets_structure":
-        res += "Discord.Gateway.ActivityAssets.t()"
-    elif ts == "activity_party_structure":
-        res += "Discord.Gateway.ActivityParty.t()"
-    elif ts == "activity_secrets_structure":
-        res += "Discord.Gateway.ActivitySecrets.t()"
-    elif ts == "activity_structure":
-        res += "Discord.Gateway.Activity.t()"
-    elif ts == "activity_timestamps_structure":
-        res += "Discord.Gateway.ActivityTimestamps.t()"
-    elif ts == "client_status_structure":
-        res += "Discord.Gateway.ClientStatus.t()"
-    elif ts == "channel_structure":
-        res += "Discord.Channel.t()"
-    elif ts == "embed_author_structure":
-        res += "Discord.Channel.EmbedAuthor.t()"
-    elif ts == "embed_footer_structure":
-        res += "Discord.Channel.EmbedFooter.t()"
-    elif ts == "embed_image_structure":
-        res += "Discord.Channel.EmbedImage.t()"
-    elif ts == "embed_provider_structure":
-        res += "Discord.Channel.EmbedProvider.t()"
-    elif ts == "embed_thumbnail_structure":
-        res += "Discord.Channel.EmbedThumbnail.t()"
-    elif ts == "embed_video_structure":
-        res += "Discord.Channel.EmbedVideo.t()"
-    elif ts == "embed_field_structure":
-        res += "Discord.Channel.EmbedField.t()"
-    elif ts == "guild_member_structure":
-        res += "Discord.Guild.GuildMember.t()"
-    elif ts == "integration_account_structure":
-        res += "Discord.Guild.IntegrationAccount.t()"
-    elif ts == "emoji_structure":
-        res += "Discord.Emoji.t()"
-    elif ts == "message_activity_structure":
-        res += "Discord.Channel.MessageActivity.t()"
-    elif ts == "message_application_structure":
-        res += "Discord.Channel.MessageApplication.t()"
-    elif ts == "message_reference_structure":
-        res += "Discord.Channel.MessageReference.t()"
-    elif ts == "optional_audit_entry_info_structure":
-        res += "Discord.AuditLog.OptionalAuditEntryInfo.t()"
-    elif ts == "user_structure":
-        res += "Discord.User.t()"
-    elif ts == "role_structure":
-        res += "Discord.Permissions.Role.t()"
-    elif ts == "integer or string":
-        res += "integer() | String.t()"
-    elif ts == "roles":
-        res += "[Discord.Guild.Role.t()]"
-    elif ts == "presence_structure":
-        res += "Discord.Gateway.Presence.t()"
-    elif ts == "null":
-        res += "nil"
-    elif ts == "two_integers_(current_size,_max_size)_structure":
-        res += "[integer()]"
-    elif ts in [
-        "unavailable_guild_structure",
-        "partial_voice_state_structure",
-        "partial_presence_update_structure",
-        "channel_mention_structure",  # TODO: Fix
-        "message_interaction_structure",  # TODO: Fix
-    ]:
-        res += "map()"
-    elif ts == "welcome_screen_structure":
-        res += "Discord.Guild.WelcomeScreen.t()"
-    elif ts == "welcome_screen_channel_structure":
-        res += "Discord.Guild.WelcomeScreenChannel.t()"
-    elif ts == "audit_log_change_structure":
-        res += "Discord.AuditLog.AuditLogChange.t()"
-    elif ts == "application_object_structure":
-        res += "Discord.Oauth2.Application.t()"
-    elif ts == "team_member_structure":
-        res += "Discord.Teams.TeamMember.t()"
-    elif ts == "sticker_structure":
-        res += "Discord.Channel.MessageSticker.t()"
-    elif ts == "embed_structure":
-        res += "Discord.Channel.Embed.t()"
-    elif ts == "reaction_structure":
-        res += "Discord.Channel.Reaction.t()"
-    elif ts == "message_reference_structure":
-        res += "Discord.Channel.MessageReference.t()"
-    elif ts == "message_structure":
-        res += "Discord.Channel.Message.t()"
-    elif ts == "team_structure":
-        res += "Discord.Teams.Team.t()"
-    elif ts == "attachment_structure":
-        res += "Discord.Channel.Attachment.t()"
-    elif ts == "overwrite_structure":
-        res += "Discord.Channel.Overwrite.t()"
-    elif ts.startswith("array"):
-        ts2 = ts.replace("array<", "").replace(">", "")
-        x = (
-            "["
-            + derive_type(
-                {
-                    "type": ts.replace("array<", "").replace(">", ""),
-                    "optional": optional,
-                    "nullable": nullable,
-                },
+atom_re = re.compile(r"[a-z_][a-zA-Z0-9_]*[?!]?")
+
+
+def atom(s):
+    if atom_re.fullmatch(s):
+        return f":{s}"
+    return f':"{unquote(s)}"'
+
+
+# IR type -> Elixir typespec, for everything that isn't a structure
+primitive_types = {
+    "boolean": "boolean()",
+    "string": "String.t()",
+    "string (can be null only in reaction emoji objects)": "String.t()",
+    "snowflake": "String.t()",
+    "integer": "integer()",
+    "array": "list()",
+    "map": "map()",
+    "timestamp": "String.t()",
+    "any": "term()",
+    "integer or string": "integer() | String.t()",
+    "roles": "[Discord.Guild.Role.t()]",
+    "null": "nil",
+    "two_integers_(current_size,_max_size)_structure": "[integer()]",
+    "unavailable_guild_structure": "map()",
+    "partial_voice_state_structure": "map()",
+    "partial_presence_update_structure": "map()",
+    # TODO: Fix
+    "channel_mention_structure": "map()",
+    # TODO: Fix
+    "message_interaction_structure": "map()",
+}
+
+# The one place derive_type, extract_type and encode_field look types up in.
+# `decode` is a template for the expression decoding a JSON value into the
+# type, or None if the JSON value will do as is. `guard` tells the type apart
+# from the rest of a union. `encode` is a template for the expression encoding
+# the type into JSON iodata, or None to go through Discord.JSON.encode/1.
+# `encode_guard` is `guard` for the decoded value, where that looks different.
+ElixirType = namedtuple(
+    "ElixirType",
+    ["typespec", "decode", "guard", "encode", "encode_guard"],
+    defaults=[None, None],
+)
+type_registry = {}
+
+# IR type -> to_json/1 encoder template, for primitives that can skip
+# Discord.JSON.encode/1's dispatch
+primitive_encoders = {
+    "boolean": "Atom.to_string({})",
+    "string": "Discord.JSON.string({})",
+    "string (can be null only in reaction emoji objects)": "Discord.JSON.string({})",
+    "snowflake": "Discord.JSON.string({})",
+    "integer": "Integer.to_string({})",
+    "timestamp": "Discord.JSON.string({})",
+}
+
+# IR type -> guard, for primitives that can show up in a union
+primitive_guards = {
+    "boolean": "is_boolean",
+    "string": "is_binary",
+    "snowflake": "is_binary",
+    "integer": "is_integer",
+    "timestamp": "is_binary",
+}
+
+# IR type -> ElixirType, for primitives that need decoding. These win over
+# primitive_types, see use_integer_snowflakes.
+decoded_types = {}
+
+# ir.enum_kind -> (typespec, guard) for the values of an enum, as quote() makes
+# them. Mixed enums get both typespecs and no guard.
+enum_kinds = {
+    "integer": ("integer()", "is_integer"),
+    "string": ("String.t()", "is_binary"),
+}
+
+# See use_atom_enums and use_deterministic_output
+options = {"atom_enums": False, "deterministic": False}
+
+
+def struct_module(module, key):
+    # (module name, nested?) for the struct emit_struct makes out of `key` in
+    # `module`. It's nested unless it's the doc's namesake, ie. user_structure
+    # in user.json is Discord.User, but embed_structure in channel.json is
+    # Discord.Channel.Embed.
+    module_name = camel(key).replace("Structure", "")
+    return module_name, module_name != camel(module)
+
+
+def elixir_module(module, key):
+    module_name, nested = struct_module(module, key)
+    if nested:
+        return f"Discord.{camel(module)}.{module_name}"
+    return f"Discord.{camel(module)}"
+
+
+def register_types():
+    # Structures and enums resolve through the corpus-wide symbol table (see
+    # ir.py), structures to whichever module ends up defining them. Anything
+    # listed by hand above wins over what the docs say.
+    type_registry.clear()
+    for ts, symbol in ir.symbols.items():
+        (values, values_guard) = enum_kinds.get(
+            symbol.kind, ("integer() | String.t()", None)
+        )
+        if ts.endswith("_structure"):
+            module = elixir_module(symbol.module, ts)
+            type_registry[ts] = ElixirType(
+                f"{module}.t()",
+                f"{module}.create({{}})",
+                "is_map",
+                f"{module}.to_json({{}})",
+            )
+        elif options["atom_enums"]:
+            # Values the enum doesn't know about are kept as they are
+            name = f"Discord.{camel(symbol.module)}.%s_{ts[: -len('_enum')]}"
+            type_registry[ts] = ElixirType(
+                f"atom() | {values}",
+                name % "decode" + "({})",
+                None,
+                f"Discord.JSON.encode({name % 'encode'}({{}}))",
+                "is_atom",
             )
-            + "]"
+        else:
+            # Enum values come out as whatever quote() makes of them
+            type_registry[ts] = ElixirType(values, None, values_guard)
+    for ts, typespec in primitive_types.items():
+        type_registry[ts] = ElixirType(
+            typespec, None, primitive_guards.get(ts), primitive_encoders.get(ts)
+        )
+    type_registry.update(decoded_types)
+
+
+def use_integer_snowflakes(enabled=True):
+    # Snowflakes as non_neg_integer(), parsed once in create/1. They take far
+    # less memory than binaries and compare faster.
+    if enabled:
+        decoded_types["snowflake"] = ElixirType(
+            "non_neg_integer()",
+            "String.to_integer({})",
+            "is_binary",
+            "Discord.JSON.snowflake({})",
+            "is_integer",
         )
-        res += x
     else:
-        print("## Warning: Unknown type:", ts, "assuming term()", file=sys.stderr)
-        res += "term()"
+        decoded_types.pop("snowflake", None)
+    refresh_types()
+
+
+def use_atom_enums(enabled=True):
+    # Fields typed as an enum get decoded into the enum's atoms in create/1,
+    # through the decode_<enum>/1 emit_enum generates.
+    options["atom_enums"] = enabled
+    refresh_types()
+
+
+def use_deterministic_output(enabled=True):
+    # Leaves the timings, the time and the docs commit out of the headers, so
+    # that a module only changes when its doc did. The pipeline keeps them in
+    # its manifest instead.
+    options["deterministic"] = enabled
+
+
+# Flag values in the docs look like `1 << 3` (or occasionally `(1 << 3) | 1`),
+# so that's all we understand: integer literals, <<, >>, | and parentheses.
+const_token_re = re.compile(
+    r"\s*(?:(0[xX][0-9a-fA-F]+)|(0[bB][01]+)|(\d+)|(<<|>>|\||\(|\)))"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def const_eval(expr):
+    def unsupported():
+        return ValueError(f"Unsupported constant expression: {expr!r}")
+
+    tokens = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        match = const_token_re.match(expr, pos)
+        if match is None:
+            raise unsupported()
+        hex_, bin_, dec, op = match.groups()
+        if hex_ is not None:
+            tokens.append(int(hex_, 16))
+        elif bin_ is not None:
+            tokens.append(int(bin_, 2))
+        elif dec is not None:
+            tokens.append(int(dec))
+        else:
+            tokens.append(op)
+        pos = match.end()
+    tokens.append(None)
+    i = 0
+
+    def take():
+        nonlocal i
+        i += 1
+        return tokens[i - 1]
+
+    def atom():
+        token = take()
+        if token == "(":
+            value = bit_or()
+            if take() != ")":
+                raise unsupported()
+            return value
+        elif isinstance(token, int):
+            return token
+        raise unsupported()
+
+    def shift():
+        value = atom()
+        while tokens[i] in ("<<", ">>"):
+            if take() == "<<":
+                value <<= atom()
+            else:
+                value >>= atom()
+        return value
+
+    def bit_or():
+        value = shift()
+        while tokens[i] == "|":
+            take()
+            value |= shift()
+        return value
+
+    value = bit_or()
+    if tokens[i] is not None:
+        raise unsupported()
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def typespec(ts, nilable):
+    # Returns the typespec along with any unknown types in it. Warning about
+    # those is left to derive_type so that every doc still reports its own.
+    # Call refresh_types() after touching the tables above.
+    elixir_type = type_registry.get(ts)
+    if elixir_type is not None:
+        res = elixir_type.typespec
+        unknown = ()
+    elif " | " in ts:
+        parts = [typespec(part, False) for part in ts.split(" | ")]
+        res = " | ".join(spec for (spec, _) in parts)
+        unknown = tuple(ts for (_, part) in parts for ts in part)
+    elif ts.startswith("array<") and ts.endswith(">"):
+        inner, unknown = typespec(ts[len("array<") : -1], nilable)
+        res = "[" + inner + "]"
+    elif ts.startswith("array"):
+        inner, unknown = typespec(ts.replace("array<", "").replace(">", ""), nilable)
+        res = "[" + inner + "]"
+    else:
+        res = "term()"
+        unknown = (ts,)
 
-    if optional or nullable:
+    if nilable:
         res += " | nil"
 
+    return res, unknown
+
+
+def refresh_types():
+    register_types()
+    typespec.cache_clear()
+    decoder.cache_clear()
+    encoder.cache_clear()
+
+
+register_types()
+ir.symbol_listeners.append(refresh_types)
+
+
+def derive_type(t, section=None, field=None):
+    res, unknown = typespec(t.type, t.optional or t.nullable)
+    for ts in unknown:
+        warn("unknown_type", "## Warning: Unknown type:", ts, "assuming term()")
+        ir.report_unresolved(ts, section, field)
     return res
 
 
+def guard(ts):
+    # How to tell a `ts` apart from the other members of a union at runtime
+    elixir_type = type_registry.get(ts)
+    if elixir_type is not None:
+        return elixir_type.guard
+    elif ts.startswith("array<"):
+        return "is_list"
+    return None
+
+
+def encode_guard(ts):
+    # guard, but for what create/1 made of the JSON value
+    elixir_type = type_registry.get(ts)
+    if elixir_type is not None and elixir_type.encode_guard is not None:
+        return elixir_type.encode_guard
+    return guard(ts)
+
+
+@functools.lru_cache(maxsize=None)
+def decoder(ts, var, depth=0):
+    # Elixir expression decoding `var` into a `ts`, or None if the JSON value
+    # is already what the typespec says. Shares typespec's cache rules.
+    elixir_type = type_registry.get(ts)
+    if elixir_type is not None:
+        if elixir_type.decode is None:
+            return None
+        return elixir_type.decode.format(var)
+    elif " | " in ts:
+        clauses = []
+        for part in ts.split(" | "):
+            decoded = decoder(part, var, depth)
+            if decoded is not None and guard(part) is not None:
+                clauses.append(f"{var} when {guard(part)}({var}) -> {decoded}")
+        if not clauses:
+            return None
+        clauses.append(f"{var} -> {var}")
+        return f"(case {var} do {'; '.join(clauses)} end)"
+    elif ts.startswith("array<") and ts.endswith(">"):
+        element = "e" if depth == 0 else f"e{depth + 1}"
+        decoded = decoder(ts[len("array<") : -1], element, depth + 1)
+        if decoded is None:
+            return None
+        return f"(for {element} <- {var}, do: {decoded})"
+    return None
+
+
 def extract_type(ts, f):
-    if ts == "activity_assets_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.ActivityAssets.create(from["{f}"]), else: nil)'
-    elif ts == "activity_party_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.ActivityParty.create(from["{f}"]), else: nil)'
-    elif ts == "activity_secrets_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.ActivitySecrets.create(from["{f}"]), else: nil)'
-    elif ts == "activity_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.Activity.create(from["{f}"]), else: nil)'
-    elif ts == "activity_timestamps_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.ActivityTimestamps.create(from["{f}"]), else: nil)'
-    elif ts == "client_status_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.ClientStatus.create(from["{f}"]), else: nil)'
-    elif ts == "presence_structure":
-        return f'if(from["{f}"], do: Discord.Gateway.Presence.create(from["{f}"]), else: nil)'
-    elif ts == "embed_author_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedAuthor.create(from["{f}"]), else: nil)'
-    elif ts == "embed_footer_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedFooter.create(from["{f}"]), else: nil)'
-    elif ts == "embed_image_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedImage.create(from["{f}"]), else: nil)'
-    elif ts == "embed_provider_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedProvider.create(from["{f}"]), else: nil)'
-    elif ts == "embed_thumbnail_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedThumbnail.create(from["{f}"]), else: nil)'
-    elif ts == "embed_video_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedVideo.create(from["{f}"]), else: nil)'
-    elif ts == "embed_field_structure":
-        return f'if(from["{f}"], do: Discord.Channel.EmbedField.create(from["{f}"]), else: nil)'
-    elif ts == "guild_member_structure":
-        return f'if(from["{f}"], do: Discord.Guild.GuildMember.create(from["{f}"]), else: nil)'
-    elif ts == "integration_account_structure":
-        return f'if(from["{f}"], do: Discord.Guild.IntegrationAccount.create(from["{f}"]), else: nil)'
-    elif ts == "message_activity_structure":
-        return f'if(from["{f}"], do: Discord.Channel.MessageActivity.create(from["{f}"]), else: nil)'
-    elif ts == "message_application_structure":
-        return f'if(from["{f}"], do: Discord.Channel.MessageApplication.create(from["{f}"]), else: nil)'
-    elif ts == "message_reference_structure":
-        return f'if(from["{f}"], do: Discord.Channel.MessageReference.create(from["{f}"]), else: nil)'
-    elif ts == "optional_audit_entry_info_structure":
-        return f'if(from["{f}"], do: Discord.AuditLog.OptionalAuditEntryInfo.create(from["{f}"]), else: nil)'
-    elif ts == "user_structure":
-        return f'if(from["{f}"], do: Discord.User.create(from["{f}"]), else: nil)'
-    elif ts == "role_structure":
-        return f'if(from["{f}"], do: Discord.Permissions.Role.create(from["{f}"]), else: nil)'
-    elif ts == "audit_log_change_structure":
-        return f'if(from["{f}"], do: Discord.AuditLog.AuditLogChange.create(from["{f}"]), else: nil)'
-    elif ts == "application_object_structure":
-        return f'if(from["{f}"], do: Discord.Oauth2.Application.create(from["{f}"]), else: nil)'
-    elif ts == "sticker_structure":
-        return f'if(from["{f}"], do: Discord.Channel.MessageSticker.create(from["{f}"]), else: nil)'
-    elif ts == "embed_structure":
-        return (
-            f'if(from["{f}"], do: Discord.Channel.Embed.create(from["{f}"]), else: nil)'
-        )
-    elif ts == "reaction_structure":
-        return f'if(from["{f}"], do: Discord.Channel.Reaction.create(from["{f}"]), else: nil)'
-    elif ts == "message_reference_structure":
-        return f'if(from["{f}"], do: Discord.Channel.MessageReference.create(from["{f}"]), else: nil)'
-    elif ts == "message_structure":
-        return f'if(from["{f}"], do: Discord.Channel.Message.create(from["{f}"]), else: nil)'
-    elif ts == "teams_structure":
-        return f'if(from["{f}"], do: Discord.Teams.Team.create(from["{f}"]), else: nil)'
-    elif ts == "attachment_structure":
-        return f'if(from["{f}"], do: Discord.Channel.Attachment.create(from["{f}"]), else: nil)'
-    elif ts == "overwrite_structure":
-        return f'if(from["{f}"], do: Discord.Channel.Overwrite.create(from["{f}"]), else: nil)'
-    else:
+    # One lookup per key, create/1 is on the hot path of every gateway event
+    decoded = decoder(ts, "v")
+    if decoded is None:
         return f'from["{f}"]'
+    return f'(case from["{f}"] do nil -> nil; v -> {decoded} end)'
 
 
-out = f"defmodule Discord.{camel(module)} do\n"
-out += "{{stats}}\n"
-out += "  # Requires typed_struct: https://github.com/ejpcmac/typed_struct\n"
-out += "  # Get it on Hex: https://hex.pm/packages/typed_struct\n"
-out += "  use TypedStruct\n"
-out += "\n"
-
-enums_generated = 0
-structs_generated = 0
-
-out += "{{enum_header}}"
-for (key, value) in data.items():
-    if key.endswith("enum"):
-        enum_name = key.replace("_enum", "")
-        out += f"  # Enum {enum_name}\n"
-        for enum_key, enum_value in value.items():
-            if isinstance(enum_value, str):
-                out_enum_value = enum_value
-                if "<<" in enum_value:
-                    # This is evil but it solves the problem
-                    out_enum_value = str(eval(enum_value))
-                out += f"  def {enum_name}_{snake(enum_key)}, do: {quote(out_enum_value)}\n"
-            elif isinstance(enum_value, dict):
-                if "desc" in enum_value:
-                    # :hahayes:
-                    desc = enum_value["desc"]
-                    out += f'  @doc "{unquote(desc)}"\n'
-                inner_value = enum_value["value"]
-                if "<<" in inner_value:
-                    # This is evil but it solves the problem
-                    inner_value = str(eval(inner_value))
-                out += (
-                    f"  def {enum_name}_{snake(enum_key)}, do: {quote(inner_value)}\n"
+@functools.lru_cache(maxsize=None)
+def encoder(ts, var, depth=0):
+    # Elixir expression encoding `var`, a `ts`, into JSON iodata. Shares
+    # typespec's cache rules.
+    elixir_type = type_registry.get(ts)
+    if elixir_type is not None and elixir_type.encode is not None:
+        return elixir_type.encode.format(var)
+    elif " | " in ts:
+        # `var` can be value.field, which won't do as a pattern
+        part_var = "u" if depth == 0 else f"u{depth + 1}"
+        clauses = []
+        for part in ts.split(" | "):
+            if encode_guard(part) is not None:
+                encoded = encoder(part, part_var, depth)
+                clauses.append(
+                    f"{part_var} when {encode_guard(part)}({part_var}) -> {encoded}"
                 )
-        out += "\n"
-        enums_generated += 1
-
-if enums_generated > 0:
-    out = out.replace("{{enum_header}}", "  # Enums\n")
-else:
-    out = out.replace("{{enum_header}}", "")
-
-out += "{{struct_header}}"
-for (key, value) in data.items():
-    if key.endswith("structure"):
-        module_name = camel(key).replace("Structure", "")
-        if module_name == camel(module):
-            out += f"  # {module} struct {key}\n"
-            out += '  @typedoc """\n'
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f"  * `:{field}`: {field_data['desc']}\n"
-            out += '  """\n'
-            out += "  typedstruct do\n"
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f"    field :{field}, {derive_type(field_data)}\n"
-            out += "  end\n\n"
-            out += "  def create(from) do\n"
-            out += f"    %Discord.{camel(module)}" + "{\n"
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f'      {field}: {extract_type(field_data["type"], unquote(field))},\n'
-            out += "    }\n"
-            out += "  end\n"
-        else:
-            out += f"  # {module} struct {key}\n"
-            out += f"  defmodule {module_name} do\n"
-            out += '    @typedoc """\n'
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f"    * `:{field}`: {field_data['desc']}\n"
-            out += '    """\n'
-            out += "    typedstruct do\n"
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f"      field :{field}, {derive_type(field_data)}\n"
-            out += "    end\n\n"
-            out += "    def create(from) do\n"
-            out += f"      %Discord.{camel(module)}.{module_name}" + "{\n"
-            for (field, field_data) in value.items():
-                if "$" in field:
-                    field = quote(field)
-                out += f'        {field}: {extract_type(field_data["type"], unquote(field))},\n'
-            out += "      }\n"
-            out += "    end\n"
-            out += "  end\n\n"
-        structs_generated += 1
-
-if structs_generated > 0:
-    out = out.replace("{{struct_header}}", "  # Structs\n")
-else:
-    out = out.replace("{{struct_header}}", "")
-
-# Remove a trailing newline
-if (structs_generated > 0 or (structs_generated == 0 and enums_generated > 0)) and out[
-    -2:
-] == "\n\n":
-    out = out[:-1]
-if (structs_generated > 0 or (structs_generated == 0 and enums_generated > 0)) and out[
-    -2:
-] == "\n\n":
-    out = out[:-1]
-out += "end"
-
-end = now()
-
-out = out.replace(
-    "{{stats}}",
-    f"""
-  # Processed {str(len(stdin_lines))} lines of JSON in {end - start}ms.
-  # Generated at {datetime.utcnow()}.
-  # Generated from discord-api-docs {sys.argv[2]}.
-  # Generated {enums_generated} enums.
-  # Generated {structs_generated} structs.
-"""[
-        1:
-    ],
+        if not clauses:
+            return f"Discord.JSON.encode({var})"
+        clauses.append(f"{part_var} -> Discord.JSON.encode({part_var})")
+        return f"(case {var} do {'; '.join(clauses)} end)"
+    elif ts.startswith("array<") and ts.endswith(">"):
+        element = "e" if depth == 0 else f"e{depth + 1}"
+        encoded = encoder(ts[len("array<") : -1], element, depth + 1)
+        return f"Discord.JSON.list({var}, fn {element} -> {encoded} end)"
+    return f"Discord.JSON.encode({var})"
+
+
+def encode_field(ts, f, optional):
+    # One entry of the list to_json/1 hands Discord.JSON.object/1: the key,
+    # already encoded, and the value. Optional fields that are nil are left
+    # out (nil entries get dropped), any other nil goes out as null.
+    key = f'~s("{unquote(f)}":)'
+    access = f"value.{f}"
+    if optional:
+        return f"if({access} != nil, do: [{key} | {encoder(ts, access)}])"
+    encoded = encoder(ts, "v")
+    return f'[{key} | (case {access} do nil -> "null"; v -> {encoded} end)]'
+
+
+def emit_enum(out, key, value):
+    enum_name = key.replace("_enum", "")
+    out(f"  # Enum {enum_name}\n")
+    pairs = []
+    for enum_key, member in value.members.items():
+        if member.desc is not None:
+            # :hahayes:
+            out(f'  @doc "{unquote(member.desc)}"\n')
+        inner_value = member.value
+        if "<<" in inner_value:
+            inner_value = str(const_eval(inner_value))
+        out(f"  def {enum_name}_{snake(enum_key)}, do: {quote(inner_value)}\n")
+        pairs.append((quote(inner_value), atom(snake(enum_key.strip()))))
+
+    # Raw value <-> atom, as function heads so that dispatching on one is a
+    # single match. Anything unknown goes through untouched. Only the first of
+    # any duplicates gets a clause, the rest could never match.
+    decoded = set()
+    out("\n")
+    for (literal, name) in pairs:
+        if enum_value_key(literal) not in decoded:
+            decoded.add(enum_value_key(literal))
+            out(f"  def decode_{enum_name}({literal}), do: {name}\n")
+    out(f"  def decode_{enum_name}(value), do: value\n")
+    encoded = set()
+    out("\n")
+    for (literal, name) in pairs:
+        if name not in encoded:
+            encoded.add(name)
+            out(f"  def encode_{enum_name}({name}), do: {literal}\n")
+    out(f"  def encode_{enum_name}(value), do: value\n")
+
+    if key.endswith("_flags_enum"):
+        emit_flags(out, enum_name, value)
+
+
+def flag_masks(value):
+    # [(atom, mask)] for every flag that's a single constant, or None if any
+    # of them isn't. "none" style zero members aren't flags.
+    masks = []
+    for enum_key, member in value.members.items():
+        try:
+            mask = const_eval(member.value)
+        except ValueError:
+            return None
+        if mask:
+            masks.append((atom(snake(enum_key.strip())), mask))
+    return masks
+
+
+def emit_flags(out, enum_name, value):
+    # Everything works on the integer bitfield, with the masks folded into
+    # literals here so that a check is a single band/2.
+    masks = flag_masks(value)
+    if not masks:
+        warn("unfoldable_flags", "## Warning: Can't fold the masks of", enum_name)
+        return
+    out("\n")
+    out(f"  defmodule {camel(enum_name)} do\n")
+    out("    import Bitwise\n")
+    out("\n")
+    out("    @flags [\n")
+    for (name, mask) in masks:
+        out(f"      {{{name}, {mask}}},\n")
+    out("    ]\n")
+    out("\n")
+    all_ = 0
+    for (_, mask) in masks:
+        all_ |= mask
+    out(f"    def all, do: {all_}\n")
+    out("\n")
+    for (name, mask) in masks:
+        out(f"    def mask({name}), do: {mask}\n")
+    out("\n")
+    for (name, mask) in masks:
+        out(f"    def has?(flags, {name}), do: band(flags, {mask}) == {mask}\n")
+    out("\n")
+    out("    def to_list(flags) do\n")
+    out("      for {flag, mask} <- @flags, band(flags, mask) == mask, do: flag\n")
+    out("    end\n")
+    out("\n")
+    out("    def from_list(flags) do\n")
+    out("      Enum.reduce(flags, 0, fn flag, acc -> bor(acc, mask(flag)) end)\n")
+    out("    end\n")
+    if enum_name == "bitwise_permission_flags":
+        emit_overwrites(out, dict(masks))
+    out("  end\n")
+
+
+def emit_overwrites(out, masks):
+    # Discord's order: @everyone's overwrite, then every one of the member's
+    # roles' combined, then the member's own. Administrators get everything.
+    out("\n")
+    out('    @doc """\n')
+    out("    Applies a channel's overwrites to a member's base permissions.\n")
+    out("\n")
+    out("    `overwrites` are the channel's overwrite structures, or any maps with\n")
+    out("    the same keys.\n")
+    out('    """\n')
+    out("    def apply_overwrites(base, overwrites, guild_id, role_ids, member_id)")
+    out(" do\n")
+    administrator = masks.get(":administrator")
+    indent = "      "
+    if administrator is not None:
+        out(f"      if band(base, {administrator}) == {administrator} do\n")
+        out("        all()\n")
+        out("      else\n")
+        indent = "        "
+    for line in [
+        "everyone = for %{id: ^guild_id} = o <- overwrites, do: o",
+        "",
+        "roles =",
+        "  for %{id: id, type: 0} = o <- overwrites,",
+        "      id != guild_id and id in role_ids,",
+        "      do: o",
+        "",
+        "member = for %{id: ^member_id, type: 1} = o <- overwrites, do: o",
+        "base |> overwrite(everyone) |> overwrite(roles) |> overwrite(member)",
+    ]:
+        out(f"{indent}{line}\n" if line else "\n")
+    if administrator is not None:
+        out("      end\n")
+    out("    end\n")
+    out("\n")
+    out("    defp overwrite(permissions, overwrites) do\n")
+    out("      {allow, deny} =\n")
+    out("        Enum.reduce(overwrites, {0, 0}, fn o, {allow, deny} ->\n")
+    out("          {bor(allow, bits(o.allow)), bor(deny, bits(o.deny))}\n")
+    out("        end)\n")
+    out("\n")
+    out("      permissions |> band(bnot(deny)) |> bor(allow)\n")
+    out("    end\n")
+    out("\n")
+    out("    # Permissions come over the wire as strings\n")
+    out("    defp bits(value) when is_binary(value), do: String.to_integer(value)\n")
+    out("    defp bits(value), do: value\n")
+
+
+def enum_value_key(literal):
+    # So that 1 and 0x01 count as the same value
+    try:
+        return int(literal, 0)
+    except ValueError:
+        return literal
+
+
+def emit_struct(out, module, key, value):
+    # Returns whether this was a nested module, ie. whether it wants a blank
+    # line after it.
+    module_name, nested = struct_module(module, key)
+    struct_name = f"Discord.{camel(module)}"
+    indent = "  "
+    out(f"  # {module} struct {key}\n")
+    if nested:
+        struct_name += f".{module_name}"
+        indent = "    "
+        out(f"  defmodule {module_name} do\n")
+
+    fields = [
+        (quote(field) if "$" in field else field, field_data)
+        for (field, field_data) in value.fields.items()
+    ]
+    out(f'{indent}@typedoc """\n')
+    for (field, field_data) in fields:
+        out(f"{indent}* `:{field}`: {field_data.desc}\n")
+    out(f'{indent}"""\n')
+    out(f"{indent}typedstruct do\n")
+    for (field, field_data) in fields:
+        spec = derive_type(field_data, key, unquote(field))
+        out(f"{indent}  field :{field}, {spec}\n")
+    out(f"{indent}end\n\n")
+    out(f"{indent}def create(from) do\n")
+    out(f"{indent}  %{struct_name}" + "{\n")
+    for (field, field_data) in fields:
+        extracted = extract_type(field_data.type, unquote(field))
+        out(f"{indent}    {field}: {extracted},\n")
+    out(f"{indent}  }}\n")
+    out(f"{indent}end\n\n")
+    out(f"{indent}def to_json(%__MODULE__{{}} = value) do\n")
+    out(f"{indent}  Discord.JSON.object([\n")
+    for (field, field_data) in fields:
+        encoded = encode_field(field_data.type, field, field_data.optional)
+        out(f"{indent}    {encoded},\n")
+    out(f"{indent}  ])\n")
+    out(f"{indent}end\n")
+    if nested:
+        out("  end\n")
+    return nested
+
+
+def emit(write, module, data, git_info, lines, start=None):
+    # Writes the module out through `write`, a chunk at a time. Nothing gets
+    # rescanned once it's been emitted: which headers are needed is known
+    # up front, and blank lines between blocks are only written once we know
+    # another block follows.
+    if start is None:
+        start = now()
+
+    enums = [(key, value) for (key, value) in data.items() if key.endswith("enum")]
+    structs = [
+        (key, value) for (key, value) in data.items() if key.endswith("structure")
+    ]
+
+    # The stats header needs the timings, so the body gets collected first
+    body = []
+    out = body.append
+    gap = False
+    if enums:
+        out("  # Enums\n")
+    for (key, value) in enums:
+        if gap:
+            out("\n")
+        emit_enum(out, key, value)
+        gap = True
+    if structs:
+        if gap:
+            out("\n")
+            gap = False
+        out("  # Structs\n")
+    for (key, value) in structs:
+        if gap:
+            out("\n")
+        gap = emit_struct(out, module, key, value)
+
+    end = now()
+    counters["enums"] += len(enums)
+    counters["structs"] += len(structs)
+
+    write(f"defmodule Discord.{camel(module)} do\n")
+    if options["deterministic"]:
+        write("  # Generated from discord-api-docs.\n")
+    else:
+        write(f"  # Processed {str(lines)} lines of JSON in {end - start}ms.\n")
+        write(f"  # Generated at {datetime.utcnow()}.\n")
+        write(f"  # Generated from discord-api-docs {git_info}.\n")
+    write(f"  # Generated {len(enums)} enums.\n")
+    write(f"  # Generated {len(structs)} structs.\n")
+    write("\n")
+    write("  # Requires typed_struct: https://github.com/ejpcmac/typed_struct\n")
+    write("  # Get it on Hex: https://hex.pm/packages/typed_struct\n")
+    write("  use TypedStruct\n")
+    write("\n")
+    for chunk in body:
+        write(chunk)
+    write("end")
+
+
+def generate(module, data, git_info, lines, start=None):
+    chunks = []
+    emit(chunks.append, module, data, git_info, lines, start)
+    return "".join(chunks)
+
+
+def json_lines(text):
+    return len(text.splitlines(keepends=True))
+
+
+def emit_document(write, document, git_info, start=None):
+    emit(write, document.module, document.table, git_info, document.lines, start)
+
+
+# What every struct's to_json/1 is built on, written out next to the modules
+json_module = r'''defmodule Discord.JSON do
+  # Encodes straight into iodata. The generated to_json/1s call the typed
+  # encoders below directly, encode/1 is for everything else.
+
+  def encode(nil), do: "null"
+  def encode(true), do: "true"
+  def encode(false), do: "false"
+  def encode(value) when is_integer(value), do: Integer.to_string(value)
+  def encode(value) when is_float(value), do: Float.to_string(value)
+  def encode(value) when is_binary(value), do: string(value)
+  def encode(value) when is_atom(value), do: string(Atom.to_string(value))
+  def encode(value) when is_list(value), do: list(value, &encode/1)
+  def encode(%{__struct__: module} = value), do: module.to_json(value)
+
+  def encode(value) when is_map(value) do
+    object(for {key, v} <- value, do: [string(to_string(key)), ?: | encode(v)])
+  end
+
+  # `fields` are "key": value iodata, nil for any to leave out
+  def object(fields) do
+    case for field <- fields, field != nil, do: field do
+      [] -> "{}"
+      [first | rest] -> [?{, first, for(field <- rest, do: [?, | field]), ?}]
+    end
+  end
+
+  def list([], _encode), do: "[]"
+
+  def list([first | rest], encode) do
+    [?[, encode.(first), for(e <- rest, do: [?, | encode.(e)]), ?]]
+  end
+
+  def snowflake(value) when is_integer(value), do: [?", Integer.to_string(value), ?"]
+  def snowflake(value), do: string(value)
+
+  def string(value) do
+    if escape?(value), do: [?", escape(value), ?"], else: [?", value, ?"]
+  end
+
+  defp escape?(<<>>), do: false
+  defp escape?(<<c, _::binary>>) when c < 0x20 or c == ?" or c == ?\\, do: true
+  defp escape?(<<_, rest::binary>>), do: escape?(rest)
+
+  defp escape(<<>>), do: []
+  defp escape(<<?", rest::binary>>), do: ["\\\"" | escape(rest)]
+  defp escape(<<?\\, rest::binary>>), do: ["\\\\" | escape(rest)]
+  defp escape(<<?\n, rest::binary>>), do: ["\\n" | escape(rest)]
+  defp escape(<<?\r, rest::binary>>), do: ["\\r" | escape(rest)]
+  defp escape(<<?\t, rest::binary>>), do: ["\\t" | escape(rest)]
+
+  defp escape(<<c, rest::binary>>) when c < 0x20 do
+    ["\\u00", Base.encode16(<<c>>) | escape(rest)]
+  end
+
+  defp escape(<<c, rest::binary>>), do: [c | escape(rest)]
+end
+'''
+
+ir.register_emitter(
+    "elixir",
+    "Elixir",
+    ".ex",
+    emit_document,
+    counters,
+    warnings,
+    support={"json": json_module},
 )
 
-print(out)
\ No newline at end of file
+
+def json_paths(paths):
+    # Directories stand for every doc's JSON directly inside of them
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if (
+                    name.endswith(".json")
+                    and not name.startswith(".")
+                    and name not in ir.pipeline_files
+                ):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def generate_files(git_info, output_dir, paths):
+    # Everything runs in this one process, so the type registry and the
+    # typespec cache stay warm from one module to the next. Every doc is
+    # loaded up front so that the symbol table covers all of them.
+    documents = []
+    for path in json_paths(paths):
+        module = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        table = json.loads(text)
+        if not all(isinstance(section, dict) for section in table.values()):
+            # Not a doc at all
+            continue
+        documents.append((ir.build(module, table, json_lines(text)), path))
+    ir.define_symbols(ir.index_documents(documents))
+    for name, text in ir.emitters["elixir"].support.items():
+        ir.write(os.path.join(output_dir, name + ".ex"), text)
+
+    # Returns every unresolved type, see ir.print_unresolved
+    unresolved = []
+    for (document, path) in documents:
+        start = now()
+        ex_path = os.path.join(output_dir, document.module + ".ex")
+        print(f">> Processing JSON -> Elixir: {ex_path}")
+        sys.stdout.flush()
+        del ir.unresolved[:]
+        chunks = []
+        emit_document(chunks.append, document, git_info, start)
+        ir.write(ex_path, "".join(chunks) + "\n")
+        unresolved += [entry + (path,) for entry in ir.unresolved]
+    return unresolved
+
+
+if __name__ == "__main__":
+    # Either mode takes --snowflake-integers, --atom-enums and
+    # --deterministic, see use_integer_snowflakes, use_atom_enums and
+    # use_deterministic_output
+    if "--snowflake-integers" in sys.argv:
+        sys.argv.remove("--snowflake-integers")
+        use_integer_snowflakes()
+    if "--atom-enums" in sys.argv:
+        sys.argv.remove("--atom-enums")
+        use_atom_enums()
+    if "--deterministic" in sys.argv:
+        sys.argv.remove("--deterministic")
+        use_deterministic_output()
+
+    if len(sys.argv) > 3:
+        # process_elixir.py "<git info>" <output dir> <json file or dir>...
+        # Exits non-zero if any type couldn't be resolved.
+        unresolved = generate_files(sys.argv[1], sys.argv[2], sys.argv[3:])
+        if unresolved:
+            ir.print_unresolved(unresolved)
+            sys.exit(1)
+    else:
+        # process_elixir.py <module> "<git info>" < module.json
+        # Only structures defined in this one doc can be resolved, use the
+        # batch mode for everything else.
+        start = now()
+        stdin = sys.stdin.read()
+        module = sys.argv[1]
+        git_info = sys.argv[2]
+        document = ir.loads(module, stdin)
+        ir.define_symbols(ir.document_symbols(document))
+        emit_document(sys.stdout.write, document, git_info, start)
+        print()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+
+# File watching for pipeline.py's --watch. Uses inotify (through
+# inotify_simple, when it's installed) and falls back to polling mtimes
+# wherever that isn't available.
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# Editors tend to save in a few steps, so changes are collected for this many
+# milliseconds after the first one before anything gets regenerated
+settle_ms = 20
+# Seconds between polls, when polling
+poll_interval = 0.05
+
+
+def changes(dirs, interval=poll_interval):
+    # Yields the sets of files in `dirs` (not recursively) that were written,
+    # created or removed since the last batch. `interval` is how often to poll
+    # if it comes to that.
+    inotify = None
+    if inotify_simple is not None:
+        try:
+            inotify = inotify_simple.INotify()
+        except OSError as e:
+            # eg. out of inotify instances
+            print(f"!! Can't use inotify ({e}), polling instead", file=sys.stderr)
+    if inotify is not None:
+        print(f">> Watching {', '.join(dirs)}")
+        return inotify_changes(inotify, dirs)
+    print(f">> Watching {', '.join(dirs)}, polling every {interval}s")
+    return polled_changes(dirs, interval)
+
+
+def inotify_changes(inotify, dirs):
+    flags = inotify_simple.flags
+    mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE
+    watches = {}
+    for path in dirs:
+        if os.path.isdir(path):
+            watches[inotify.add_watch(path, mask)] = path
+    while True:
+        events = inotify.read(read_delay=settle_ms)
+        changed = {
+            os.path.join(watches[event.wd], event.name)
+            for event in events
+            if event.wd in watches and event.name
+        }
+        if changed:
+            yield changed
+
+
+def snapshot(dirs):
+    stats = {}
+    for path in dirs:
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            stats[os.path.join(path, name)] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def diff(before, after):
+    return {
+        path
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    }
+
+
+def polled_changes(dirs, interval):
+    before = snapshot(dirs)
+    while True:
+        time.sleep(interval)
+        after = snapshot(dirs)
+        if diff(before, after):
+            # Same as with inotify, let the editor finish
+            time.sleep(settle_ms / 1000)
+            after = snapshot(dirs)
+            yield diff(before, after)
+        before = after